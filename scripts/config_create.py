@@ -5,6 +5,7 @@ import pandas as pd
 from glob import glob
 import subprocess
 import os
+from bisect import bisect_left
 
 
 root = "/".join(abspath(__file__).split("/")[:-2])
@@ -33,6 +34,50 @@ except:
 #        amplicon = False
 #except:
 #    amplicon = False
+def fastq_index(runpath):
+    # One walk of the run directory; sorted basenames let each sample be
+    # resolved with a bisect on its id instead of a recursive glob. Linked
+    # directories are followed, but each directory only once so link cycles
+    # cannot loop the walk
+    index = []
+    st = os.stat(runpath)
+    seen = {(st.st_dev, st.st_ino)}
+    for dirpath, dirnames, filenames in os.walk(runpath, followlinks=True):
+        keep = []
+        for x in dirnames:
+            if x.startswith("."):
+                continue
+            try:
+                st = os.stat(f"{dirpath}/{x}")
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) not in seen:
+                seen.add((st.st_dev, st.st_ino))
+                keep.append(x)
+        dirnames[:] = keep
+        for f in filenames:
+            if f.endswith("fastq.gz") and not f.startswith("."):
+                index.append((f, os.path.relpath(f"{dirpath}/{f}", runpath)))
+    index.sort()
+    return index
+
+
+def find_fastq(index, id, read):
+    found = []
+    i = bisect_left(index, (id,))
+    while i < len(index) and index[i][0].startswith(id):
+        name, path = index[i]
+        if read in name[len(id):-len("fastq.gz")]:
+            found.append((name, path))
+        i += 1
+    # s1_R1 should not be ambiguous with s10_R1
+    if len(found) > 1:
+        exact = [x for x in found if not x[0][len(id)].isalnum()]
+        if len(exact) > 0:
+            found = exact
+    return [path for name, path in found]
+
+
 df = pd.read_csv(samplesheet)#argv[1])
 dfd = df.to_dict("index")
 
@@ -57,12 +102,13 @@ if 'ont' in experiment_type.lower():
             "{}/lib/EXP-NBD196.yaml".format(root), "r"
         ) as y:
             barseqs = yaml.safe_load(y)
+    if 'fastq_pass' in runpath:
+        fastq_pass = glob(runpath + '/*/')
+    else:
+        fastq_pass = glob(runpath + '/fastq_pass/*/')
+    barcode_dirs = set(x.split("/")[-2] for x in fastq_pass)
     for d in dfd.values():
-        if 'fastq_pass' in runpath:
-            fastq_pass = glob(runpath + '/*/')
-        else:
-            fastq_pass = glob(runpath + '/fastq_pass/*/')
-        if d['Barcode #'] in [x.split("/")[-2] for x in fastq_pass]:
+        if d['Barcode #'] in barcode_dirs:
 
             data["barcodes"][d["Sample ID"]] = {
                 "sample_type": d["Sample Type"],
@@ -77,27 +123,37 @@ if 'ont' in experiment_type.lower():
         print("failed samples detected: Barcodes\n", failures.strip())
 else:
     data = {'runid':runpath.split('/')[-1], 'samples':{}}
+    fastqs = fastq_index(runpath)
+    failures = []
     for d in dfd.values():
-        id = d['Sample ID']
-        print(f"runpath = {runpath}\nid = {id}")
-        R1_fastq = glob(f"{runpath}/**/{id}*R1*fastq.gz", recursive=True)[0]
-        R2_fastq = glob(f"{runpath}/**/{id}*R2*fastq.gz", recursive=True)[0]
-        if len(R1_fastq) < 1 or len(R2_fastq) < 1:
-            print(f"Fastq pair not found for sample {id}")
-            exit()
+        id = str(d['Sample ID'])
+        pair = []
+        for read in ("R1", "R2"):
+            found = find_fastq(fastqs, id, read)
+            if len(found) == 1:
+                pair.append(found[0])
+            elif len(found) == 0:
+                failures.append(f"{id}: no {read} fastq found")
+            else:
+                failures.append(f"{id}: {read} matches more than one fastq: {', '.join(found)}")
+        if len(pair) < 2:
+            continue
+        R1_fastq, R2_fastq = pair
         if amplicon:
             data["samples"][d["Sample ID"]] = {
                 "sample_type": d["Sample Type"],
-                "R1_fastq": R1_fastq.replace(f'{runpath}/',''), 
-                "R2_fastq": R2_fastq.replace(f'{runpath}/',''), 
+                "R1_fastq": R1_fastq, 
+                "R2_fastq": R2_fastq, 
                 "Library" : primer_schema
             }
         else:
             data["samples"][d["Sample ID"]] = {
                 "sample_type": d["Sample Type"],
-                "R1_fastq": R1_fastq.replace(f'{runpath}/',''), 
-                "R2_fastq": R2_fastq.replace(f'{runpath}/',''), 
+                "R1_fastq": R1_fastq, 
+                "R2_fastq": R2_fastq, 
             }
+    if len(failures) > 0:
+        exit(f"Fastq pairs not resolved in {runpath}:\n\t" + "\n\t".join(failures))
 with open(runpath.replace("fastq_pass", "") + "/config.yaml", "w") as out:
     yaml.dump(data, out, default_flow_style=False)
 
@@ -106,13 +162,17 @@ if "ont" in experiment_type.lower():
 
     if "flu" in experiment_type.lower():
         snakefile_path += "influenza_snakefile"
+        dash_args = "ont flu"
     elif "spike" in experiment_type.lower():
         snakefile_path += "sc2_spike_snakefile"
+        dash_args = "ont sc2-spike"
 else:
     if "flu" in experiment_type.lower():
         snakefile_path += "illumina_influenza_snakefile"
+        dash_args = "illumina flu"
     elif "sc2" in experiment_type.lower():
         snakefile_path += "illumina_sc2_snakefile"
+        dash_args = "illumina sc2"
 
 if "TESTDEV-QUICK" in clean_option:
     snake_cmd = (
@@ -150,6 +210,26 @@ else:
         )
 os.chdir(runpath.replace("fastq_pass", ""))
 print(f"\n\nSNAKEMAKE CMD:\n {snake_cmd}\n\n")
+# Fill the dashboard sample by sample while IRMA is still running
+if "LIVE-DASHBOARD" in clean_option:
+    os.makedirs("logs", exist_ok=True)
+    # A start marker left by an earlier run would stop the watcher at once
+    if os.path.isfile("IRMA/prepareIRMAjson.start"):
+        os.remove("IRMA/prepareIRMAjson.start")
+    with open("logs/prepareIRMAjson.watch.log", "w") as watch_log:
+        watcher = subprocess.Popen(
+            ["python3", f"{root}/workflow/scripts/prepareIRMAjson.py", "IRMA", "samplesheet.csv"]
+            + dash_args.split()
+            + ["--watch"],
+            stdout=watch_log,
+            stderr=subprocess.STDOUT,
+        )
+if "LIVE-DASHBOARD" in clean_option:
+    # The watcher is stopped before the final dashboard build so the two never
+    # write dash-json at the same time
+    subprocess.run(f"{snake_cmd} --omit-from prepareIRMAjson", shell=True)
+    watcher.terminate()
+    watcher.wait()
 subprocess.run(snake_cmd, shell=True)
 
 # Remove extraneous intermediate files and tar archive logs, F1 bam and plurality consensus
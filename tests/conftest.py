@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+from os.path import abspath, dirname
+
+import pytest
+
+scripts = f"{dirname(dirname(abspath(__file__)))}/workflow/scripts"
+if scripts not in sys.path:
+    sys.path.insert(0, scripts)
+
+
+def build_dashboard(run, *options):
+    subprocess.run(
+        [
+            sys.executable,
+            f"{scripts}/prepareIRMAjson.py",
+            "IRMA",
+            "samplesheet.csv",
+            "ont",
+            "flu",
+            *options,
+        ],
+        cwd=run,
+        env=dict(os.environ, PYTHONHASHSEED="0"),
+        check=True,
+        stdout=subprocess.DEVNULL,
+        timeout=600,
+    )
+
+
+def read_dash_json(run):
+    outputs = {}
+    for name in sorted(os.listdir(f"{run}/dash-json")):
+        if os.path.isfile(f"{run}/dash-json/{name}"):
+            with open(f"{run}/dash-json/{name}", "rb") as d:
+                outputs[name] = d.read()
+    return outputs
+
+
+@pytest.fixture
+def build():
+    return build_dashboard
+
+
+@pytest.fixture
+def dash_json():
+    return read_dash_json
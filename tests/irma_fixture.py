@@ -0,0 +1,149 @@
+import json
+import random
+from os import makedirs
+from os.path import abspath, dirname, getsize
+
+refs = {"A_HA_H1": ("4", "HA", 1700), "A_NA_N1": ("6", "NA", 1400)}
+dais_refs = f"{dirname(dirname(abspath(__file__)))}/workflow/data/references/dais_references_flu.seq"
+
+
+def reference_alignments():
+    alignments = {}
+    with open(dais_refs) as d:
+        for line in d:
+            fields = line.rstrip("\n").split("\t")
+            if fields[0] == "CALI07" and fields[3] in ("HA", "NA"):
+                alignments[fields[3]] = fields[6]
+    return alignments
+
+
+def write_sample(irma, sample, rng, alignments):
+    # A finished ONT flu IRMA sample with HA and NA assembled; returns its
+    # DAIS-ribosome .seq lines
+    d = f"{irma}/{sample}"
+    for sub in ["tables", "amended_consensus", "intermediate/0-ITERATIVE-REFERENCES"]:
+        makedirs(f"{d}/{sub}", exist_ok=True)
+    initial = rng.randint(40000, 60000)
+    passed = initial - 100
+    matched = passed - 2000
+    with open(f"{d}/tables/READ_COUNTS.txt", "w") as o:
+        o.write("Record\tReads\tPatterns\tPairsAndWidows\n")
+        for record, n in [
+            ("1-initial", initial),
+            ("2-passQC", passed),
+            ("2-failQC", 100),
+            ("3-match", matched),
+            ("3-nomatch", passed - matched),
+            ("4-A_HA_H1", matched // 2),
+            ("4-A_NA_N1", matched - matched // 2),
+        ]:
+            o.write(f"{record}\t{n}\t{n}\t{n}\n")
+    seq_lines = []
+    for ref, (seg, protein, length) in refs.items():
+        with open(f"{d}/intermediate/0-ITERATIVE-REFERENCES/R0-{ref}.ref", "w") as o:
+            o.write(f">{ref}\n{'A' * length}\n")
+        base = rng.randint(20, 400)
+        consensus = []
+        with open(f"{d}/tables/{ref}-coverage.txt", "w") as o:
+            o.write(
+                "Reference_Name\tPosition\tCoverage Depth\tConsensus\tDeletions\t"
+                "Ambiguous_Bases\tConsensus_Count\tConsensus_Average_Quality\n"
+            )
+            for p in range(1, length + 1 - rng.randint(0, 40)):
+                depth = max(0, int(base + rng.gauss(0, base / 5)))
+                base_call = rng.choice("ACGT") if depth > 0 else "N"
+                consensus.append(base_call)
+                o.write(
+                    f"{ref}\t{p}\t{depth}\t{base_call}\t0\t0\t{depth}\t{rng.uniform(20, 40):.2f}\n"
+                )
+        with open(f"{d}/tables/{ref}-variants.txt", "w") as o:
+            o.write(
+                "Reference_Name\tPosition\tTotal\tConsensus_Allele\tMinority_Allele\t"
+                "Consensus_Count\tMinority_Count\tMinority_Frequency\t"
+                "Consensus_Average_Quality\tMinority_Average_Quality\t"
+                "ConfidenceNotMacErr\tPairedUB\tQualityUB\tAllele_Type\n"
+            )
+            for p in sorted(rng.sample(range(1, length), 8)):
+                total = rng.randint(50, 500)
+                minor = rng.randint(1, total // 3)
+                o.write(
+                    f"{ref}\t{p}\t{total}\tA\tG\t{total - minor}\t{minor}\t{minor / total}"
+                    "\t33.1\t30.2\t0.99\t0.01\t0.01\tMinority\n"
+                )
+        with open(f"{d}/tables/{ref}-insertions.txt", "w") as o:
+            o.write(
+                "Reference_Name Upstream_Position Insert Context Called Count Total Frequency\n"
+            )
+            for p in sorted(rng.sample(range(1, length), 3)):
+                total = rng.randint(50, 500)
+                count = rng.randint(1, total)
+                o.write(f"{ref} {p} AC ACGTAcgTACG T {count} {total} {count / total}\n")
+        with open(f"{d}/tables/{ref}-deletions.txt", "w") as o:
+            o.write(
+                "Reference_Name\tUpstream_Position\tLength\tContext\tCalled\tCount\tTotal\tFrequency\n"
+            )
+            for p in sorted(rng.sample(range(1, length), 3)):
+                total = rng.randint(50, 500)
+                count = rng.randint(1, total)
+                o.write(f"{ref}\t{p}\t2\tACGTA--TACG\tD\t{count}\t{total}\t{count / total}\n")
+        with open(f"{d}/amended_consensus/{sample}_{seg}.fa", "w") as o:
+            o.write(f">{sample}_{seg}\n{''.join(consensus)}\n")
+        aln = alignments[protein]
+        seq_lines.append(
+            "\t".join(
+                [f"{sample}_{seg}", ref, "CALI07", protein, "x", aln.replace("-", ""), aln]
+                + ["cds", "", "", "ATG", "ATG", "1..100", "1..100"]
+            )
+        )
+    return seq_lines
+
+
+def write_a2m_coverage(irma, sample, ref="SARS-CoV-2"):
+    # An HMM-aligned coverage table; the inserted base at Position 4 has no
+    # HMM_Position and HMM_Position 5, deleted in the sample, has no Position
+    makedirs(f"{irma}/{sample}/tables", exist_ok=True)
+    path = f"{irma}/{sample}/tables/{ref}-coverage.a2m.txt"
+    with open(path, "w") as o:
+        o.write(
+            "Reference_Name\tPosition\tCoverage Depth\tConsensus\tDeletions\t"
+            "Ambiguous_Bases\tConsensus_Count\tConsensus_Average_Quality\tHMM_Position\n"
+        )
+        for p, hmm in [("1", 1), ("2", 2), ("3", 3), ("4", ""), ("", 5), ("5", 6)]:
+            o.write(f"{ref}\t{p}\t31\tA\t0\t0\t31\t35.5\t{hmm}\n")
+    return path
+
+
+def write_dais_results(irma, seq_lines):
+    results = f"{irma}/dais_results"
+    makedirs(results, exist_ok=True)
+    with open(f"{results}/DAIS_ribosome.seq", "w") as o:
+        o.writelines(f"{line}\n" for line in seq_lines)
+    for suffix in ["ins", "del"]:
+        open(f"{results}/DAIS_ribosome.{suffix}", "w").close()
+    with open(f"{results}/dais_complete.json", "w") as o:
+        json.dump(
+            {
+                "files": {
+                    f"DAIS_ribosome.{s}": getsize(f"{results}/DAIS_ribosome.{s}")
+                    for s in ["seq", "ins", "del"]
+                }
+            },
+            o,
+        )
+
+
+def write_irma_run(run, samples, seed=1):
+    # A small ONT flu run: <run>/samplesheet.csv and <run>/IRMA/<sample>/...
+    rng = random.Random(seed)
+    alignments = reference_alignments()
+    irma = f"{run}/IRMA"
+    makedirs(irma, exist_ok=True)
+    with open(f"{run}/samplesheet.csv", "w") as o:
+        o.write("Barcode #,Sample ID,Sample Type\n")
+        for i, sample in enumerate(samples):
+            o.write(f"barcode{i + 1:02d},{sample},Test\n")
+    seq_lines = []
+    for sample in samples:
+        seq_lines += write_sample(irma, sample, rng, alignments)
+    write_dais_results(irma, seq_lines)
+    return irma
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import irma2pandas
+
+
+def coverage_frame(seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for sample in ["s2", "s1"]:
+        for ref, length in [("SARS-CoV-2", 30000), ("A_HA_H1", 1700)]:
+            depths = rng.integers(0, 300, length).astype(np.int32)
+            consensus = np.where(depths < 5, "N", "A")
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "Sample": sample,
+                        "Reference_Name": ref,
+                        "Position": np.arange(1, length + 1, dtype=np.int32),
+                        "Coverage Depth": depths,
+                        "Consensus": consensus,
+                    }
+                )
+            )
+    # Rows of one sample interleaved with another's, as a concat of tables is not
+    return pd.concat(frames).sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("virus", ["flu", "sc2-spike"])
+def test_stats_from_index_match_a_groupby(virus):
+    coverage_df = coverage_frame()
+    ref_lens = {"SARS-CoV-2": 29903, "A_HA_H1": 1701}
+    stats_df = irma2pandas.coverage_stats(
+        irma2pandas.coverage_index(coverage_df), ref_lens, virus
+    )
+    window = irma2pandas.coverage_windows.get(virus, (0, np.inf))
+    for (sample, ref), rows in coverage_df.groupby(["Sample", "Reference_Name"]):
+        row = stats_df[(stats_df["Sample"] == sample) & (stats_df["Reference"] == ref)]
+        covered = (rows["Consensus"] != "N").sum()
+        assert row["Covered Length"].item() == covered
+        assert row["% Reference Covered"].item() == covered / ref_lens[ref] * 100
+        depths = rows.loc[rows["Position"].between(*window), "Coverage Depth"]
+        if len(depths) == 0:
+            assert np.isnan(row["Median Coverage"].item())
+            continue
+        assert row["Median Coverage"].item() == depths.median()
+        assert row["Mean Coverage"].item() == pytest.approx(depths.mean())
+        assert row["% Positions >= 100x"].item() == (depths >= 100).mean() * 100
@@ -0,0 +1,96 @@
+import json
+import os
+import subprocess
+import sys
+from os.path import abspath, dirname
+
+import completion
+import dais_ribosome
+
+wrapper = f"{dirname(dirname(abspath(__file__)))}/workflow/scripts/daiswrapper.sh"
+
+# Stands in for `docker exec dais ribosome --module M in.fasta out.seq out.ins
+# out.del`: later shards finish first, and it records whether the completion
+# marker was visible while it ran
+stub = """
+import os, sys, time
+fasta, seq, ins, dels = sys.argv[3:7]
+ids = [l[1:].split()[0] for l in open(fasta) if l.startswith(">")]
+time.sleep(0.2 / (1 + int(seq.rsplit("_", 1)[1].split(".")[0])))
+if os.path.exists("IRMA/dais_results/dais_complete.json"):
+    open("marker_seen_during_translation", "w").close()
+with open(seq, "w") as o:
+    o.writelines(f"{i}\\t{p}\\tX\\n" for i in ids for p in ["HA", "NA"])
+with open(ins, "w") as o:
+    o.writelines(f"{i}\\tins\\n" for i in ids[::2])
+open(dels, "w").close()
+"""
+
+
+def test_balanced_shards_pack_longest_first():
+    records = [(f"r{i}", "A" * n) for i, n in enumerate([3, 7, 2, 5, 4, 3])]
+    shards = dais_ribosome.balanced_shards(records, 2)
+    assert sorted(i for shard in shards for i in shard) == list(range(6))
+    assert [sum(len(records[i][1]) for i in shard) for shard in shards] == [12, 12]
+    assert all(shard == sorted(shard) for shard in shards)
+    assert len(dais_ribosome.balanced_shards(records[:1], 4)) == 1
+
+
+def test_sharded_run_through_the_wrapper_with_a_stub(tmp_path):
+    ids = [f"s{i}_{seg}" for i in range(6) for seg in [4, 6]]
+    with open(tmp_path / "DAIS_ribosome_input.fasta", "w") as o:
+        for n, seq_id in enumerate(ids):
+            o.write(f">{seq_id}\n{'ACGT' * (10 + (n * 7) % 13)}\n")
+    (tmp_path / "stub.py").write_text(stub)
+    results = tmp_path / "IRMA" / "dais_results"
+    os.makedirs(results)
+    (results / completion.dais_marker).write_text('{"files": {}}')
+    subprocess.run(
+        [
+            "bash",
+            wrapper,
+            "-i",
+            f"{tmp_path}/DAIS_ribosome_input.fasta",
+            "-m",
+            "INFLUENZA",
+            "-n",
+            "3",
+        ],
+        cwd=tmp_path,
+        env=dict(os.environ, DAIS_TRANSLATOR=f"{sys.executable} stub.py"),
+        check=True,
+    )
+    seq_ids = [l.split("\t")[0] for l in open(results / "DAIS_ribosome.seq")]
+    assert seq_ids == [i for i in ids for _ in range(2)]
+    ins_ids = [l.split("\t")[0] for l in open(results / "DAIS_ribosome.ins")]
+    assert len(ins_ids) > 0 and ins_ids == sorted(ins_ids, key=ids.index)
+    assert not (tmp_path / "marker_seen_during_translation").exists()
+    assert completion.marker_complete(str(results), completion.dais_marker)
+    with open(results / completion.dais_marker) as d:
+        assert sorted(json.load(d)["files"]) == [
+            f"DAIS_ribosome.{s}" for s in ["del", "ins", "seq"]
+        ]
+    assert not (tmp_path / "IRMA" / "dais_shards").exists()
+
+
+def test_marker_is_written_after_the_merge(tmp_path, monkeypatch):
+    with open(tmp_path / "DAIS_ribosome_input.fasta", "w") as o:
+        o.write(">s1_4\nACGT\n>s1_6\nACGTACGT\n")
+    (tmp_path / "stub.py").write_text(stub)
+    calls = []
+    merge, mark = dais_ribosome.merge_results, dais_ribosome.write_marker
+    monkeypatch.setattr(
+        dais_ribosome,
+        "merge_results",
+        lambda *a: (calls.append("merge"), merge(*a))[1],
+    )
+    monkeypatch.setattr(
+        dais_ribosome,
+        "write_marker",
+        lambda *a: (calls.append("marker"), mark(*a))[1],
+    )
+    monkeypatch.chdir(tmp_path)
+    dais_ribosome.run_dais(
+        "DAIS_ribosome_input.fasta", "INFLUENZA", 2, f"{sys.executable} stub.py"
+    )
+    assert calls == ["merge", "marker"]
@@ -0,0 +1,43 @@
+import json
+import multiprocessing
+
+import pandas as pd
+
+import dashtables
+
+
+def test_shard_updates_merge_into_the_manifest(tmp_path):
+    dash_json = str(tmp_path)
+    first = pd.DataFrame({"Sample": ["s1", "s1", "s2"], "Depth": [1, 2, 3]})
+    dashtables.write_dash_shards(first, dash_json, "coverage_shards", "Sample")
+    second = pd.DataFrame({"Sample": ["s2", "s3"], "Depth": [4, 5]})
+    dashtables.write_dash_shards(second, dash_json, "coverage_shards", "Sample")
+    with open(f"{dash_json}/{dashtables.manifest_name}") as d:
+        shards = json.load(d)["coverage_shards"]["shards"]
+    assert sorted(shards) == ["s1", "s2", "s3"]
+    assert shards["s1"]["rows"] == 2
+    s2 = pd.read_json(f"{dash_json}/{shards['s2']['file']}", orient="split")
+    assert s2["Depth"].tolist() == [4]
+
+
+def write_entries(dash_json, names):
+    for name in names:
+        dashtables.update_manifest(dash_json, name, {"rows": 0})
+
+
+def test_manifest_updates_from_separate_processes_are_kept(tmp_path):
+    dash_json = str(tmp_path)
+    ctx = multiprocessing.get_context("fork")
+    writers = [
+        ctx.Process(
+            target=write_entries,
+            args=(dash_json, [f"table{i}_{j}" for j in range(25)]),
+        )
+        for i in range(4)
+    ]
+    for w in writers:
+        w.start()
+    for w in writers:
+        w.join()
+    with open(f"{dash_json}/{dashtables.manifest_name}") as d:
+        assert len(json.load(d)) == 100
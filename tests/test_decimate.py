@@ -0,0 +1,51 @@
+import numpy as np
+
+import irma2pandas
+
+
+def noisy_coverage(mean, sd, n=29903, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.maximum(0, rng.normal(mean, sd, n)).astype(np.int32)
+
+
+def test_decimation_is_bounded_near_threshold():
+    for mean, sd, threshold in [(55, 8, 50), (120, 30, 100), (50, 50, 50)]:
+        depths = noisy_coverage(mean, sd)
+        keep = irma2pandas.decimate_coverage(depths, 5000, threshold)
+        assert len(keep) <= 5000 + 2
+        assert np.all(np.diff(keep) > 0)
+        assert keep[0] == 0 and keep[-1] == len(depths) - 1
+
+
+def test_wide_gaps_keep_exact_edges():
+    depths = noisy_coverage(300, 20)
+    depths[10000:12000] = 0
+    depths[20000:21000] = 30
+    keep = set(irma2pandas.decimate_coverage(depths, 1000, 100))
+    assert {9999, 10000, 11999, 12000} <= keep
+    assert {19999, 20000, 20999, 21000} <= keep
+
+
+def test_short_traces_are_untouched():
+    depths = noisy_coverage(55, 8, n=4000)
+    assert np.array_equal(
+        irma2pandas.decimate_coverage(depths, 5000, 50), np.arange(4000)
+    )
+
+
+def test_short_zero_gaps_keep_exact_edges():
+    depths = noisy_coverage(300, 20)
+    depths[15000:15003] = 0
+    depths[25000] = 0
+    keep = set(irma2pandas.decimate_coverage(depths, 1000, 100))
+    assert {14999, 15000, 15002, 15003} <= keep
+    assert {24999, 25000, 25001} <= keep
+
+
+def test_many_zero_gaps_stay_within_budget():
+    depths = noisy_coverage(300, 20)
+    depths[::7] = 0
+    depths[3001:3502] = 0
+    keep = irma2pandas.decimate_coverage(depths, 1000, 100)
+    assert len(keep) <= 1000
+    assert {3000, 3001, 3501, 3502} <= set(keep)
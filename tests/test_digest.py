@@ -0,0 +1,47 @@
+import os
+import shutil
+
+import irma2pandas
+import irma_digest
+from irma_fixture import write_irma_run
+
+
+def test_build_from_digests_matches_build_from_tables(tmp_path, build, dash_json):
+    run = tmp_path / "run"
+    irma = write_irma_run(run, ["s1", "s2", "s3"])
+    tables = tmp_path / "tables"
+    shutil.copytree(run, tables, copy_function=shutil.copy2)
+    for sample in ["s1", "s2", "s3"]:
+        irma_digest.write_digest(
+            irma, irma_digest.build_digest(irma, sample, "flu", 5000, 50)
+        )
+    build(run)
+    build(tables)
+    fingerprints = irma2pandas.sample_fingerprints(irma)
+    assert len(irma_digest.load_digests(irma, fingerprints, "flu")) == 3
+    digested, full = dash_json(run), dash_json(tables)
+    assert sorted(digested) == sorted(full)
+    for name in full:
+        assert digested[name] == full[name], name
+
+
+def test_digested_samples_tables_are_not_parsed(tmp_path, build, dash_json):
+    run = tmp_path / "run"
+    irma = write_irma_run(run, ["s1", "s2", "s3"])
+    tables = tmp_path / "tables"
+    shutil.copytree(run, tables, copy_function=shutil.copy2)
+    for sample in ["s1", "s2"]:
+        irma_digest.write_digest(
+            irma, irma_digest.build_digest(irma, sample, "flu", 5000, 50)
+        )
+    shutil.rmtree(irma2pandas.irma_cache_dir(irma), ignore_errors=True)
+    # Same size and mtime, so the digests stay current, but unparseable
+    for table in (run / "IRMA" / "s1" / "tables").iterdir():
+        st = table.stat()
+        table.write_bytes(b"\0" * st.st_size)
+        os.utime(table, ns=(st.st_atime_ns, st.st_mtime_ns))
+    build(run)
+    build(tables)
+    digested, full = dash_json(run), dash_json(tables)
+    for name in ["reads.json", "coverage.json", "alleles.json", "indels.json"]:
+        assert digested[name] == full[name], name
@@ -0,0 +1,65 @@
+import json
+
+import numpy as np
+import pytest
+
+import figspec
+
+orjson = pytest.importorskip("orjson")
+
+
+def encode_both(fig, monkeypatch):
+    figspec.template.cache_clear()
+    fast = figspec.figure2json(fig)
+    monkeypatch.setattr(figspec, "orjson", None)
+    figspec.template.cache_clear()
+    slow = figspec.figure2json(fig)
+    monkeypatch.setattr(figspec, "orjson", orjson)
+    figspec.template.cache_clear()
+    return fast, slow
+
+
+def test_encoders_write_identical_figures(monkeypatch):
+    fig = figspec.figure(
+        [
+            {
+                "customdata": ["all"] * 4,
+                "line": {"color": "#3366CC"},
+                "mode": "lines",
+                "name": "A_HA_H1",
+                "x": np.array([1, 2, 3, 1701], dtype=np.int32),
+                "y": np.array([0, 12, 57, 1], dtype=np.int32),
+                "type": "scatter",
+            },
+            {
+                "colorscale": figspec.colorscale("gnbu"),
+                "x": ["s1", "s2"],
+                "y": ["HA", "NA"],
+                "z": [np.float64(123.5), 0.0],
+                "zmax": np.int64(200),
+                "type": "heatmap",
+            },
+        ],
+        {
+            "title": {"text": "s1 – HA"},
+            "yaxis": {"range": [0, np.float64(57) ** 0.1]},
+            "height": 600,
+        },
+    )
+    fast, slow = encode_both(fig, monkeypatch)
+    assert fast == slow
+
+
+def test_encoders_agree_on_edge_values(monkeypatch):
+    fig = figspec.figure(
+        [
+            {
+                "y": np.array([1e-12, 1e20, np.nan]),
+                "z": np.array([[0.1, 0.2]], dtype=np.float32),
+                "text": [float("nan"), float("inf"), np.float32(0.3)],
+            }
+        ]
+    )
+    fast, slow = encode_both(fig, monkeypatch)
+    assert json.loads(fast) == json.loads(slow)
+    assert json.loads(slow)["data"][0]["y"][2] is None
@@ -0,0 +1,23 @@
+import random
+import shutil
+
+from irma_fixture import reference_alignments, write_irma_run, write_sample
+
+
+def test_incremental_matches_full_build(tmp_path, build, dash_json):
+    run = tmp_path / "run"
+    irma = write_irma_run(run, ["s1", "s2", "s3"])
+    build(run, "--incremental")
+    write_sample(irma, "s2", random.Random(7), reference_alignments())
+    build(run, "--incremental")
+    full = tmp_path / "full"
+    shutil.copytree(
+        run,
+        full,
+        ignore=shutil.ignore_patterns("dash-json", ".table_cache", "*.fasta"),
+    )
+    build(full)
+    incremental_outputs, full_outputs = dash_json(run), dash_json(full)
+    assert sorted(incremental_outputs) == sorted(full_outputs)
+    for name in full_outputs:
+        assert incremental_outputs[name] == full_outputs[name], name
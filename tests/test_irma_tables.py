@@ -0,0 +1,31 @@
+import numpy as np
+
+import irma2pandas
+from irma_fixture import write_a2m_coverage
+
+
+def test_blank_positions_are_read_as_missing(tmp_path):
+    path = write_a2m_coverage(str(tmp_path), "s1")
+    df = irma2pandas.irmatable2frame(path)
+    assert df["Coverage Depth"].dtype == np.int32
+    assert df["Position"].isna().tolist() == [False] * 4 + [True, False]
+    assert df["HMM_Position"].isna().tolist() == [False] * 3 + [True, False, False]
+    assert df["HMM_Position"].dropna().tolist() == [1, 2, 3, 5, 6]
+
+
+def test_complete_positions_are_stored_as_int32(tmp_path):
+    path = write_a2m_coverage(str(tmp_path), "s1")
+    with open(path) as t:
+        lines = [line for line in t if "\t\t" not in line and "\t\n" not in line]
+    with open(path, "w") as t:
+        t.writelines(lines)
+    df = irma2pandas.irmatable2frame(path)
+    assert df["Position"].dtype == np.int32
+    assert df["HMM_Position"].dtype == np.int32
+
+
+def test_a2m_coverage_loads_and_indexes(tmp_path):
+    write_a2m_coverage(str(tmp_path), "s1")
+    coverage_df = irma2pandas.dash_irma_coverage_df(str(tmp_path), processes=1)
+    cov_index = irma2pandas.coverage_index(coverage_df)
+    assert len(cov_index["s1"]["depths"]) == 6
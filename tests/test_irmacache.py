@@ -0,0 +1,44 @@
+import os
+
+import pandas as pd
+import pytest
+
+import irmacache
+
+pytest.importorskip("pyarrow")
+
+
+def parse_counts(f, scale=1):
+    df = pd.read_csv(f, sep="\t")
+    return df.assign(Reads=df["Reads"] * scale)
+
+
+def test_variants_of_one_table_are_cached_side_by_side(tmp_path):
+    table = tmp_path / "READ_COUNTS.txt"
+    table.write_text("Record\tReads\n1-initial\t10\n")
+    cache_dir = str(tmp_path / "cache")
+    for _ in range(2):
+        plain = irmacache.cached_table(str(table), parse_counts, cache_dir, "v|plain")
+        scaled = irmacache.cached_table(
+            str(table), lambda f: parse_counts(f, 2), cache_dir, "v|scaled"
+        )
+    assert plain["Reads"].tolist() == [10] and scaled["Reads"].tolist() == [20]
+    assert len(os.listdir(cache_dir)) == 2
+    table.write_text("Record\tReads\n1-initial\t11\n")
+    os.utime(table, ns=(1, 1))
+    plain = irmacache.cached_table(str(table), parse_counts, cache_dir, "v|plain")
+    assert plain["Reads"].tolist() == [11]
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_sweep_drops_entries_of_removed_tables(tmp_path):
+    kept, gone = tmp_path / "kept.txt", tmp_path / "gone.txt"
+    cache_dir = str(tmp_path / "cache")
+    for table in [kept, gone]:
+        table.write_text("Record\tReads\n1-initial\t10\n")
+        irmacache.cached_table(str(table), parse_counts, cache_dir, "v")
+    (tmp_path / "cache" / "0123456789abcdef_0123456789abcdef.feather").write_bytes(b"")
+    gone.unlink()
+    irmacache.sweep_missing(cache_dir, [str(kept)])
+    [entry] = os.listdir(cache_dir)
+    assert entry.startswith(irmacache.cache_entry(str(kept), cache_dir, "v")[0])
@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+from os.path import dirname
+
+import irma2pandas
+import refcatalog
+from irma_fixture import write_irma_run
+
+
+def test_default_build_reads_bundled_irma_references(tmp_path, monkeypatch):
+    (tmp_path / "FLU.fasta").write_text(">A_HA_H1\n" + "A" * 60 + "\nACG\n>A_NP\nACGT\n")
+    (tmp_path / "CoV.fasta").write_text(">SARS-CoV-2 Wuhan\n" + "A" * 120 + "\n")
+    monkeypatch.setattr(refcatalog, "irma_refs_dir", str(tmp_path))
+    header, payload = refcatalog.build_catalog()
+    assert header["ref_lens"] == {"A_HA_H1": 63, "A_NP": 4, "SARS-CoV-2": 120}
+    assert len(payload) > 0
+
+
+def test_stale_catalog_is_not_written_at_runtime(tmp_path):
+    path = tmp_path / "reference_catalog.bin"
+    catalog = refcatalog.load_catalog.__wrapped__(str(path))
+    assert not path.exists()
+    assert len(catalog["aa"]) > 0
+    assert catalog["ref_proteins"]["HA"][0] == "A_HA_H10"
+
+
+def test_sample_references_come_before_the_catalog(tmp_path, monkeypatch):
+    irma = write_irma_run(tmp_path / "run", ["s1"])
+    refs = f"{irma}/s1/intermediate/0-ITERATIVE-REFERENCES"
+    open(f"{refs}/R0-A_NA_N1.ref", "w").close()
+    monkeypatch.setattr(
+        refcatalog,
+        "load_catalog",
+        lambda: {"ref_lens": {"A_HA_H1": 1701, "A_NA_N1": 1410}},
+    )
+    assert irma2pandas.reference_lens(irma) == {"A_HA_H1": 1700, "A_NA_N1": 1410}
+
+
+def test_image_paths_come_from_the_environment(tmp_path):
+    paths = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import refcatalog; print(refcatalog.catalog_path, refcatalog.irma_refs_dir)",
+        ],
+        cwd=dirname(refcatalog.__file__),
+        env=dict(
+            os.environ,
+            SPYNE_REFERENCE_CATALOG=f"{tmp_path}/catalog.bin",
+            SPYNE_IRMA_REFS=f"{tmp_path}/irma",
+        ),
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout.split()
+    assert paths == [f"{tmp_path}/catalog.bin", f"{tmp_path}/irma"]
@@ -0,0 +1,21 @@
+import pytest
+
+import subsample_reads
+
+
+@pytest.mark.parametrize("n1,n2", [(3, 2), (2, 3), (1, 0)])
+def test_paired_records_rejects_unequal_files(n1, n2):
+    records = subsample_reads.paired_records(
+        iter(range(n1)), iter(range(n2)), {"pairs": 0}
+    )
+    with pytest.raises(SystemExit):
+        list(records)
+
+
+def test_paired_records_counts_pairs():
+    counts = {"pairs": 0}
+    pairs = subsample_reads.paired_records(
+        iter(["a", None, "c"]), iter(["x", "y", "z"]), counts
+    )
+    assert list(pairs) == [("a", "x"), None, ("c", "z")]
+    assert counts["pairs"] == 2
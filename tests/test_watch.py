@@ -0,0 +1,38 @@
+import shutil
+
+import pandas as pd
+
+import dashtables
+from irma_fixture import write_irma_run
+
+
+def finish(irma, samples):
+    for sample in samples:
+        open(f"{irma}/{sample}.irma.fin", "w").close()
+
+
+def test_watch_keeps_the_coverage_table_current(tmp_path, build):
+    run = tmp_path / "run"
+    irma = write_irma_run(run, ["s1", "s2", "s3"])
+    full = tmp_path / "full"
+    shutil.copytree(run, full)
+    finish(irma, ["s1", "s2", "s3"])
+    build(run, "--watch", "--watch-batch", "2", "--watch-interval", "1")
+    build(full)
+    live = dashtables.read_dash_table(f"{run}/dash-json", "coverage")
+    final = dashtables.read_dash_table(f"{full}/dash-json", "coverage")
+    # Live updates append samples in the order they finish
+    live, final = (
+        df.sort_values("Sample", kind="mergesort").reset_index(drop=True)
+        for df in (live, final)
+    )
+    pd.testing.assert_frame_equal(live, final)
+
+
+def test_watch_stops_once_the_final_build_starts(tmp_path, build):
+    run = tmp_path / "run"
+    irma = write_irma_run(run, ["s1", "s2", "s3"])
+    finish(irma, ["s1"])
+    open(f"{irma}/prepareIRMAjson.start", "w").close()
+    build(run, "--watch", "--watch-interval", "1")
+    assert not (run / "dash-json" / dashtables.manifest_name).exists()
@@ -0,0 +1,82 @@
+import ctypes
+import ctypes.util
+import json
+import select
+import time
+from os import O_CLOEXEC, O_NONBLOCK, close, getpid, makedirs, read, remove, replace
+from os.path import getsize
+
+dais_marker = "dais_complete.json"
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+
+
+def write_marker(directory, files, marker_name):
+    marker = f"{directory}/{marker_name}"
+    sizes = {f.split("/")[-1]: getsize(f) for f in files}
+    with open(f"{marker}.{getpid()}.tmp", "w") as out:
+        json.dump({"files": sizes, "finished": time.time()}, out, indent=1)
+    replace(f"{marker}.{getpid()}.tmp", marker)
+
+
+def clear_marker(directory, marker_name):
+    try:
+        remove(f"{directory}/{marker_name}")
+    except FileNotFoundError:
+        pass
+
+
+def marker_complete(directory, marker_name):
+    try:
+        with open(f"{directory}/{marker_name}") as d:
+            sizes = json.load(d)["files"]
+        return all(getsize(f"{directory}/{f}") == size for f, size in sizes.items())
+    except (FileNotFoundError, ValueError, KeyError):
+        return False
+
+
+def inotify_watch(directory):
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(O_NONBLOCK | O_CLOEXEC)
+    except (OSError, AttributeError, TypeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, directory.encode(), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        close(fd)
+        return None
+    return fd
+
+
+def wait_for_event(fd, timeout):
+    # Sleep until something is written or renamed into the watched directory,
+    # or for the whole timeout without an inotify fd
+    if fd is None:
+        time.sleep(timeout)
+    elif select.select([fd], [], [], timeout)[0]:
+        try:
+            while read(fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+
+def wait_for_marker(directory, marker_name, timeout=60):
+    # Block until the producer's marker lists files that are all present at
+    # their recorded sizes; inotify wakes us on writes/renames in directory,
+    # otherwise fall back to polling once a second
+    makedirs(directory, exist_ok=True)
+    deadline = time.time() + timeout
+    fd = inotify_watch(directory)
+    try:
+        while not marker_complete(directory, marker_name):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            wait_for_event(fd, min(1, remaining) if fd is None else remaining)
+        return True
+    finally:
+        if fd is not None:
+            close(fd)
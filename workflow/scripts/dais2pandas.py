@@ -1,23 +1,20 @@
 import pandas as pd
+import numpy as np
 from os.path import dirname, realpath, basename, isfile
 from glob import glob
 from re import findall
+from fastaio import read_fasta  # type: ignore
+import refcatalog  # type: ignore
 
 repo_path = realpath(dirname(dirname(__file__)))
 
 
 def fasta2dic(fasta, dais_ref_format=False):
     seq_dic = {}
-    with open(fasta, "r") as d:
-        for line in d.readline():
-            if line[0] == ">":
-                if dais_ref_format:
-                    seq_handle = "|".join(line[1:].strip().split("|")[:2])
-                else:
-                    seq_handle = line[1:].strip()
-                seq_dic[seq_handle] = ""
-            else:
-                seq_dic[seq_handle] += line.strip()
+    for seq_handle, seq in read_fasta(fasta):
+        if dais_ref_format:
+            seq_handle = "|".join(seq_handle.split("|")[:2])
+        seq_dic[seq_handle] = seq
     return seq_dic
 
 
@@ -146,23 +143,47 @@ def AAvars(refseq, sampseq):
         return ""
 
 
+def aa_array(seq):
+    return np.frombuffer(seq.encode(), dtype=np.uint8)
+
+
+def batch_AAvars(refseq, sampseqs):
+    # Same output as AAvars for every sample sequence, computed as one
+    # comparison of a (samples x residues) uint8 matrix against the reference
+    if isinstance(refseq, str):
+        refseq = aa_array(refseq)
+    ref = refseq
+    lens = np.array([min(len(s), len(ref)) for s in sampseqs], dtype=int)
+    width = lens.max() if len(lens) > 0 else 0
+    samps = np.zeros((len(sampseqs), width), dtype=np.uint8)
+    for i, s in enumerate(sampseqs):
+        samps[i, : lens[i]] = aa_array(s[: lens[i]])
+    diff = (samps != ref[:width]) & (np.arange(width) < lens[:, None])
+    rows, cols = np.nonzero(diff)
+    vars = [
+        f"{chr(r)}{pos}{chr(s)}"
+        for r, pos, s in zip(ref[cols], cols + 1, samps[rows, cols])
+    ]
+    counts = np.bincount(rows, minlength=len(sampseqs))
+    stops = np.cumsum(counts)
+    return [", ".join(vars[stop - n : stop]) for n, stop in zip(counts, stops)], counts
+
+
 def compute_dais_variants(results_path):
-    refs = ref_seqs()
-    ref_dic = (
-        refs.groupby(["Sample", "Protein"]).agg(lambda x: x.tolist()).to_dict("index")
-    )
+    catalog = refcatalog.load_catalog()
     seqs = seq_df(results_path)
-    seq_dic = (
-        seqs.groupby(["Sample", "Protein"]).agg(lambda x: x.tolist()).to_dict("index")
-    )
-    seqs["AA Variants"] = seqs.apply(
-        lambda x: AAvars(
-            ref_dic[(x["Reference"], x["Protein"])]["Aligned AA Sequence"][0],
-            seq_dic[(x["Sample"], x["Protein"])]["Aligned AA Sequence"][0],
-        ),
-        axis=1,
+    # Every row of a (Sample, Protein) is compared using that pair's first sequence
+    sampseqs = seqs.groupby(["Sample", "Protein"])["Aligned AA Sequence"].transform(
+        "first"
     )
-    seqs["AA Variant Count"] = seqs["AA Variants"].map(lambda x: len(x.split(",")) if x != '' else 0)
+    seqs["AA Variants"] = ""
+    seqs["AA Variant Count"] = 0
+    for (ref, protein), rows in seqs.groupby(["Reference", "Protein"]).indices.items():
+        vars, counts = batch_AAvars(
+            refcatalog.ref_aa(catalog, ref, protein), list(sampseqs.iloc[rows])
+        )
+        seqs.iloc[rows, seqs.columns.get_loc("AA Variants")] = vars
+        seqs.iloc[rows, seqs.columns.get_loc("AA Variant Count")] = counts
     seqs = seqs[["Sample", "Reference", "Protein", "AA Variant Count", "AA Variants"]]
     seqs = seqs.sort_values(by=["Protein","Sample","AA Variant Count"]).drop_duplicates(subset=["Sample", "Protein"], keep="first")
     return seqs
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+import heapq
+import shlex
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from os import getpid, makedirs, replace
+from os.path import basename, dirname
+from shutil import rmtree
+from sys import argv, exit
+
+from fastaio import read_fasta, write_fasta  # type: ignore
+from completion import clear_marker, dais_marker, write_marker  # type: ignore
+
+dais_suffixes = ("seq", "ins", "del")
+default_translator = "docker exec dais ribosome"
+
+
+def balanced_shards(records, n):
+    # Longest sequences first onto the currently lightest shard (LPT), then
+    # each shard keeps the input order of its records
+    heap = [(0, i) for i in range(n)]
+    shards = [[] for _ in range(n)]
+    for idx in sorted(range(len(records)), key=lambda i: (-len(records[i][1]), i)):
+        total, shard = heapq.heappop(heap)
+        shards[shard].append(idx)
+        heapq.heappush(heap, (total + len(records[idx][1]), shard))
+    return [sorted(shard) for shard in shards if len(shard) > 0]
+
+
+def translate(translator, module, fasta, dais_out):
+    cmd = shlex.split(translator) + [
+        "--module",
+        module,
+        fasta,
+        *[f"{dais_out}.{suffix}" for suffix in dais_suffixes],
+    ]
+    print(" ".join(cmd))
+    return subprocess.run(cmd).returncode
+
+
+def merge_results(shard_outs, order, results_dir, name):
+    for suffix in dais_suffixes:
+        lines = []
+        for shard, shard_out in enumerate(shard_outs):
+            try:
+                with open(f"{shard_out}.{suffix}") as d:
+                    for n, line in enumerate(d):
+                        seq_id = line.split("\t", 1)[0]
+                        lines.append((order.get(seq_id, -1), shard, n, line))
+            except FileNotFoundError:
+                pass
+        lines.sort(key=lambda x: x[:3])
+        out = f"{results_dir}/{name}.{suffix}"
+        with open(f"{out}.{getpid()}.tmp", "w") as o:
+            o.writelines(line for *_, line in lines)
+        replace(f"{out}.{getpid()}.tmp", out)
+
+
+def run_dais(fasta, module, shards, translator=default_translator):
+    # fasta is given as the translator sees it (e.g. {runid}/DAIS_ribosome_input.fasta
+    # inside the dais container); its directory is the translator's view of the
+    # run directory
+    translator_root = dirname(fasta)
+    local_fasta = basename(fasta)
+    name = local_fasta.split(".")[0]
+    if name.endswith("_input"):
+        name = name[: -len("_input")]
+    results_dir = "IRMA/dais_results"
+    shard_dir = "IRMA/dais_shards"
+    makedirs(results_dir, exist_ok=True)
+    makedirs(shard_dir, exist_ok=True)
+    clear_marker(results_dir, dais_marker)
+    records = list(read_fasta(local_fasta))
+    order = {}
+    for i, (seq_id, seq) in enumerate(records):
+        order.setdefault(seq_id.split()[0], i)
+    jobs = []
+    shards = max(1, min(shards, len(records)))
+    for s, shard in enumerate(balanced_shards(records, shards)):
+        shard_out = f"{shard_dir}/{name}_{s:03d}"
+        write_fasta(f"{shard_out}.fasta", (records[i] for i in shard))
+        remote_out = f"{translator_root}/{shard_out}" if translator_root else shard_out
+        jobs.append((f"{remote_out}.fasta", remote_out, shard_out))
+    print(f"Translating {len(records)} sequences from {local_fasta} in {len(jobs)} shards")
+    with ThreadPoolExecutor(max_workers=max(1, len(jobs))) as pool:
+        returncodes = list(
+            pool.map(lambda job: translate(translator, module, job[0], job[1]), jobs)
+        )
+    failed = [job[2] for job, code in zip(jobs, returncodes) if code != 0]
+    if len(failed) > 0:
+        exit(f"DAIS-ribosome failed for shards: {', '.join(failed)}")
+    merge_results([job[2] for job in jobs], order, results_dir, name)
+    write_marker(
+        results_dir,
+        [f"{results_dir}/{name}.{suffix}" for suffix in dais_suffixes],
+        dais_marker,
+    )
+    rmtree(shard_dir, ignore_errors=True)
+    print(f"DAIS-ribosome results saved to {results_dir}/{name}.{{seq,ins,del}}")
+
+
+if __name__ == "__main__":
+    if len(argv) < 4:
+        exit(
+            f"\n\tUSAGE: python {__file__} <input.fasta> <module> <shards> [translator command]\n"
+            f"\n\t\t*<input.fasta> is the path the translator sees; its directory is the run directory"
+            f"\n\t\t*Shards are balanced by total sequence length and translated concurrently"
+            f"\n\t\t*Translator command defaults to '{default_translator}'\n"
+        )
+    translator = " ".join(argv[4:]) if len(argv) > 4 else default_translator
+    run_dais(argv[1], argv[2], int(argv[3]), translator)
@@ -1,22 +1,15 @@
 #!/usr/bin/env bash
-while getopts 'i:m:' OPTION
+while getopts 'i:m:n:' OPTION
 do
 	case $OPTION in
 	i ) input=$OPTARG;; 
 	m ) MODULE=$OPTARG;;
+	n ) shards=$OPTARG;;
 	esac
 done
 
-
-dais_out=$(echo $input|cut -d '.' -f 1)
-dais_out=${dais_out%"_input"} 
-
-[[ ! -d IRMA/dais_results ]] && mkdir IRMA/dais_results
-cmd="docker exec  \
-    dais ribosome \
-    --module $MODULE $input ${dais_out}.seq ${dais_out}.ins ${dais_out}.del"
+# DAIS_TRANSLATOR overrides the dais container, e.g. with a local stub for testing
+cmd="python3 $(dirname $0)/dais_ribosome.py $input $MODULE ${shards:-1} ${DAIS_TRANSLATOR:-docker exec dais ribosome}"
 
 echo $cmd
-eval $cmd && \
-sleep 10 && \
-mv ${dais_out}* IRMA/dais_results || mv DAIS* IRMA/dais_results
+eval $cmd
@@ -0,0 +1,153 @@
+import pandas as pd
+import json
+from fcntl import LOCK_EX, flock
+from os import getpid, makedirs, replace
+from os.path import isfile
+from threading import Lock
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+table_suffixes = {"json": "json", "parquet": "parquet", "arrow": "arrow"}
+manifest_name = "tables.json"
+manifest_lock = Lock()
+
+
+def atomic_path(path):
+    return f"{path}.{getpid()}.tmp"
+
+
+def write_json_table(df, path, double_precision):
+    with open(atomic_path(path), "w") as out:
+        if double_precision is None:
+            df.to_json(out, orient="split")
+        else:
+            df.to_json(out, orient="split", double_precision=double_precision)
+    replace(atomic_path(path), path)
+
+
+def write_parquet_table(df, path):
+    pq.write_table(
+        pa.Table.from_pandas(df), atomic_path(path), compression="zstd"
+    )
+    replace(atomic_path(path), path)
+
+
+def write_arrow_table(df, path):
+    table = pa.Table.from_pandas(df)
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+    with pa.OSFile(atomic_path(path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+    replace(atomic_path(path), path)
+
+
+def update_manifest(dash_json, name, entry):
+    manifest = f"{dash_json}/{manifest_name}"
+    # The lock file serializes a live watcher and the final build as well as
+    # this process's threads
+    with manifest_lock, open(f"{manifest}.lock", "w") as lock:
+        flock(lock, LOCK_EX)
+        try:
+            with open(manifest) as d:
+                tables = json.load(d)
+        except (FileNotFoundError, ValueError):
+            tables = {}
+        if "shards" in entry and "shards" in tables.get(name, {}):
+            entry = dict(entry, shards=dict(tables[name]["shards"], **entry["shards"]))
+        tables[name] = entry
+        with open(atomic_path(manifest), "w") as out:
+            json.dump(tables, out, indent=1, sort_keys=True)
+        replace(atomic_path(manifest), manifest)
+
+
+def write_table_file(df, stem, table_format, double_precision):
+    if table_format not in table_suffixes:
+        raise ValueError(f"unknown dash table format {table_format}")
+    if table_format != "json" and pa is None:
+        print(f"pyarrow is not installed, writing {stem} as json")
+        table_format = "json"
+    path = f"{stem}.{table_suffixes[table_format]}"
+    try:
+        if table_format == "parquet":
+            write_parquet_table(df, path)
+        elif table_format == "arrow":
+            write_arrow_table(df, path)
+    except pa.ArrowException as E:
+        print(f"could not write {stem} as {table_format} ({E}), writing json")
+        table_format = "json"
+        path = f"{stem}.json"
+    if table_format == "json":
+        write_json_table(df, path, double_precision)
+    return path, table_format
+
+
+def write_dash_table(df, dash_json, name, table_format="json", double_precision=3):
+    path, table_format = write_table_file(
+        df, f"{dash_json}/{name}", table_format, double_precision
+    )
+    update_manifest(
+        dash_json,
+        name,
+        {
+            "file": path.split("/")[-1],
+            "format": table_format,
+            "rows": len(df),
+            "columns": [str(c) for c in df.columns],
+        },
+    )
+    return path
+
+
+def write_dash_shards(
+    df, dash_json, name, by, table_format="json", double_precision=3
+):
+    # One table per value of `by` under dash_json/name/; the manifest entry
+    # for name lists every shard written so far, so an update only writes
+    # the shards it was given
+    makedirs(f"{dash_json}/{name}", exist_ok=True)
+    shards = {}
+    for key, shard_df in df.groupby(by, sort=False, observed=True):
+        path, shard_format = write_table_file(
+            shard_df.reset_index(drop=True),
+            f"{dash_json}/{name}/{key}",
+            table_format,
+            double_precision,
+        )
+        shards[str(key)] = {
+            "file": f"{name}/{path.split('/')[-1]}",
+            "format": shard_format,
+            "rows": len(shard_df),
+        }
+    update_manifest(
+        dash_json,
+        name,
+        {"columns": [str(c) for c in df.columns], "shards": shards},
+    )
+    return f"{dash_json}/{name}"
+
+
+def dash_table_path(dash_json, name):
+    try:
+        with open(f"{dash_json}/{manifest_name}") as d:
+            path = f"{dash_json}/{json.load(d)[name]['file']}"
+    except (FileNotFoundError, ValueError, KeyError):
+        path = f"{dash_json}/{name}.json"
+    if isfile(path):
+        return path
+    return None
+
+
+def read_dash_table(dash_json, name):
+    path = dash_table_path(dash_json, name)
+    if path is None:
+        raise FileNotFoundError(f"no {name} table found in {dash_json}")
+    if path.endswith(".parquet"):
+        return pq.read_table(path, memory_map=True).to_pandas()
+    elif path.endswith(".arrow"):
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).read_all().to_pandas()
+    return pd.read_json(path, orient="split", dtype=False, convert_dates=False)
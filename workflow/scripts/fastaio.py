@@ -0,0 +1,22 @@
+from os import getpid, replace
+
+
+def read_fasta(fasta):
+    seq_id, chunks = None, []
+    with open(fasta, "r", buffering=1 << 20) as d:
+        for line in d:
+            if line[0] == ">":
+                if seq_id is not None:
+                    yield seq_id, "".join(chunks)
+                seq_id, chunks = line[1:].strip(), []
+            elif seq_id is not None:
+                chunks.append(line.strip())
+    if seq_id is not None:
+        yield seq_id, "".join(chunks)
+
+
+def write_fasta(fasta, records):
+    tmp = f"{fasta}.{getpid()}.tmp"
+    with open(tmp, "w", buffering=1 << 20) as out:
+        out.writelines(f">{seq_id}\n{seq}\n" for seq_id, seq in records)
+    replace(tmp, fasta)
@@ -0,0 +1,81 @@
+import json
+from functools import lru_cache
+from os import replace
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.colors import get_colorscale
+
+from dashtables import atomic_path  # type: ignore
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Figures are built as plain dicts in the same shape plotly.io.to_json emits,
+# skipping graph_objects validation; plotly is only asked once per process for
+# the default template and for named colorscales
+
+
+def to_builtin(obj):
+    if isinstance(obj, (np.ndarray, np.generic)):
+        if obj.dtype == np.float32:
+            # Shortest float32 repr, as orjson writes them
+            return obj.astype(str).astype(float).tolist()
+        return obj.tolist()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def json_dumps(obj):
+    # Same document as orjson: compact, UTF-8 and NaN/Infinity as null
+    encoded = json.dumps(
+        obj, default=to_builtin, separators=(",", ":"), ensure_ascii=False
+    )
+    if "NaN" in encoded or "Infinity" in encoded:
+        encoded = json.dumps(
+            json.loads(encoded, parse_constant=lambda c: None),
+            separators=(",", ":"),
+            ensure_ascii=False,
+        )
+    return encoded.encode()
+
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(
+            obj, default=to_builtin, option=orjson.OPT_SERIALIZE_NUMPY
+        )
+    return json_dumps(obj)
+
+
+@lru_cache(maxsize=None)
+def template():
+    return dumps(json.loads(pio.to_json(go.Figure()))["layout"]["template"])
+
+
+@lru_cache(maxsize=None)
+def colorscale(name):
+    return get_colorscale(name)
+
+
+def figure(data, layout=None):
+    return {"data": data, "layout": layout or {}}
+
+
+def figure2json(fig):
+    # The template is the bulk of every figure, so it is serialized once and
+    # spliced into each layout
+    layout = dumps(fig["layout"])
+    if layout == b"{}":
+        layout = b'{"template":' + template() + b"}"
+    else:
+        layout = layout[:-1] + b',"template":' + template() + b"}"
+    return b'{"data":' + dumps(fig["data"]) + b',"layout":' + layout + b"}"
+
+
+def write_figure(fig, path):
+    with open(atomic_path(path), "wb") as out:
+        out.write(figure2json(fig))
+    replace(atomic_path(path), path)
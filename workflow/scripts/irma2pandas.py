@@ -1,9 +1,19 @@
 import pandas as pd
+import numpy as np
+from pandas.api.types import is_categorical_dtype, union_categoricals
 from os.path import dirname, basename, isfile
-from glob import glob
+from glob import glob, escape
+from hashlib import sha1
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from functools import partial
+from os import cpu_count, stat
+from fastaio import read_fasta  # type: ignore
+from irmacache import cached_table, sweep_missing  # type: ignore
+import refcatalog  # type: ignore
+import figspec  # type: ignore
 import plotly.express as px
 from re import findall
-import plotly.graph_objects as go
 
 def seg(s):
     return findall(r"HA|NA|MP|NP|NS|PA|PB1|PB2|SARS-CoV-2", s)
@@ -58,49 +68,284 @@ def dash_reads_to_sankey(df, virus):
         arrangement = "freeform"
     else:
         arrangement = "snap"
-    fig = go.Figure(
-        data=[
-            go.Sankey(
-                arrangement=arrangement,
-                node=dict(
-                    pad=15,
-                    thickness=20,
-                    label=labels,
-                    x=x_pos,
-                    y=y_pos,
-                    color=color,
-                    hovertemplate="%{label} %{value} reads <extra></extra>",
-                ),
-                link=dict(
-                    source=source,
-                    target=target,
-                    value=value,
-                    color=color[1:],
-                    hovertemplate="<extra></extra>",
-                ),
-            )
+    return figspec.figure(
+        [
+            {
+                "arrangement": arrangement,
+                "link": {
+                    "color": color[1:],
+                    "hovertemplate": "<extra></extra>",
+                    "source": source,
+                    "target": target,
+                    "value": value,
+                },
+                "node": {
+                    "color": color,
+                    "hovertemplate": "%{label} %{value} reads <extra></extra>",
+                    "label": labels,
+                    "pad": 15,
+                    "thickness": 20,
+                    "x": x_pos,
+                    "y": y_pos,
+                },
+                "type": "sankey",
+            }
         ]
     )
-    return fig
 
 
-def irmatable2df(irmaFiles):
-    df = pd.DataFrame()
-    for f in irmaFiles:
-        sample = basename(dirname(dirname(f)))
-        if "insertions" not in f:
-            df_prime = pd.read_csv(f, sep="\t", index_col=False)
-        else:
-            df_prime = pd.read_csv(f, sep="\s+", index_col=False)
-        df_prime.insert(loc=0, column="Sample", value=sample)
-        df = df.append(df_prime)
+# Bump when the parsing of IRMA tables changes to invalidate cached tables
+irma_parser_version = 3
+# Coverage, variants and indels have a row per position per sample, so they
+# are loaded compact: categorical sample, reference and allele columns,
+# 32-bit positions and counts and float32 frequencies and qualities
+irma_table_dtypes = {
+    "READ_COUNTS.txt": {"Record": str, "Reads": int},
+    "coverage.txt": {
+        "Sample": "category",
+        "Reference_Name": "category",
+        "HMM_Position": "int32",
+        "Position": "int32",
+        "Coverage Depth": "int32",
+        "Consensus": "category",
+        "Deletions": "int32",
+        "Ambiguous_Bases": "int32",
+        "Consensus_Count": "int32",
+        "Consensus_Average_Quality": "float32",
+    },
+    "variants.txt": {
+        "Sample": "category",
+        "Reference_Name": "category",
+        "HMM_Position": "int32",
+        "Position": "int32",
+        "Total": "int32",
+        "Consensus_Allele": "category",
+        "Minority_Allele": "category",
+        "Consensus_Count": "int32",
+        "Minority_Count": "int32",
+        "Minority_Frequency": "float32",
+        "Consensus_Average_Quality": "float32",
+        "Minority_Average_Quality": "float32",
+        "Allele_Type": "category",
+    },
+    "insertions.txt": {
+        "Sample": "category",
+        "Reference_Name": "category",
+        "Upstream_Position": "int32",
+        "HMM_Position": "int32",
+        "Insert": str,
+        "Context": str,
+        "Count": "int32",
+        "Total": "int32",
+        "Frequency": "float32",
+    },
+    "deletions.txt": {
+        "Sample": "category",
+        "Reference_Name": "category",
+        "Upstream_Position": "int32",
+        "HMM_Position": "int32",
+        "Length": "int32",
+        "Context": str,
+        "Count": "int32",
+        "Total": "int32",
+        "Frequency": "float32",
+    },
+}
+
+
+# Frequencies are rounded while still float64, then stored at their dtype
+irma_table_decimals = {"Minority_Frequency": 3, "Frequency": 3}
+# a2m tables leave positions blank where the sample has bases the HMM does not,
+# so positions are read as float and only stored at their dtype when complete
+irma_position_cols = ["Position", "HMM_Position", "Upstream_Position"]
+irma_chunk_rows = 100000
+
+
+def round_decimals(values, decimals):
+    # np.round agrees with f"{x:.3f}" except for values sitting on a half
+    # once scaled, where x * 10**decimals can tip either way; those few are
+    # formatted exactly instead
+    scaled = values * 10**decimals
+    rounded = np.round(values, decimals)
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    rounded[near_half] = [float(f"{x:.{decimals}f}") for x in values[near_half]]
+    return rounded
+
+
+def irma_dtypes(f):
+    for suffix, dtypes in irma_table_dtypes.items():
+        if f.replace(".a2m", "").endswith(suffix):
+            return dtypes
+    return None
+
+
+def irmatable2frame(f, min_freq=None, usecols=None):
+    # Tables are read in chunks; only the usecols columns are parsed and rows
+    # whose rounded frequency is below min_freq are dropped chunk by chunk,
+    # so memory follows the rows kept rather than the size of the table
+    sample = basename(dirname(dirname(f)))
+    dtypes = irma_dtypes(f) or {}
+    read_dtypes = {
+        col: float if col in irma_table_decimals or col in irma_position_cols else dtype
+        for col, dtype in dtypes.items()
+    }
+    if usecols is not None:
+        wanted = set(usecols)
+        usecols = lambda col: col in wanted
+    if "insertions" not in f:
+        sep = "\t"
+    else:
+        sep = "\s+"
+    chunks = []
+    for chunk in pd.read_csv(
+        f,
+        sep=sep,
+        index_col=False,
+        dtype=read_dtypes,
+        usecols=usecols,
+        chunksize=irma_chunk_rows,
+    ):
+        for col, decimals in irma_table_decimals.items():
+            if col in dtypes and col in chunk.columns:
+                rounded = round_decimals(chunk[col].to_numpy(), decimals)
+                if min_freq is not None:
+                    chunk = chunk[rounded >= min_freq]
+                    rounded = rounded[rounded >= min_freq]
+                chunk = chunk.assign(**{col: rounded.astype(dtypes[col])})
+        chunks.append(chunk)
+    if len(chunks) == 0:
+        chunks.append(pd.read_csv(f, sep=sep, index_col=False, usecols=usecols, nrows=0))
+    df = concat_frames(chunks).reset_index(drop=True)
+    for col in irma_position_cols:
+        if col in dtypes and col in df.columns and df[col].notna().all():
+            df[col] = df[col].astype(dtypes[col])
+    df.insert(loc=0, column="Sample", value=sample)
+    if "Sample" in dtypes:
+        df["Sample"] = df["Sample"].astype(dtypes["Sample"])
     return df
 
 
-def dash_irma_reads_df(irma_path):
-    readFiles = glob(irma_path + "/*/tables/READ_COUNTS.txt")
+def concat_frames(frames):
+    # pd.concat falls back to object for categoricals whose categories differ,
+    # so every frame gets the union of the categories first
+    frames = [f for f in frames if len(f.columns) > 0] or frames
+    for col in frames[0].columns:
+        if all(col in f.columns and is_categorical_dtype(f[col]) for f in frames):
+            dtype = pd.CategoricalDtype(
+                union_categoricals([f[col] for f in frames]).categories
+            )
+            frames = [f.astype({col: dtype}) for f in frames]
+    return pd.concat(frames)
+
+
+def cached_irmatable2frame(f, cache_dir, min_freq=None, usecols=None):
+    # The filter and projection are part of the cache fingerprint
+    version = f"{irma_parser_version}|{min_freq}|{sorted(usecols or [])}"
+    return cached_table(
+        f,
+        partial(irmatable2frame, min_freq=min_freq, usecols=usecols),
+        cache_dir,
+        version,
+    )
+
+
+def irma_cache_dir(irma_path):
+    return f"{irma_path}/.table_cache"
+
+
+def sweep_table_cache(irma_path):
+    sweep_missing(irma_cache_dir(irma_path), glob(f"{irma_path}/*/tables/*"))
+
+
+def start_worker(barrier):
+    global worker_barrier
+    worker_barrier = barrier
+
+
+def wait_for_workers():
+    worker_barrier.wait()
+
+
+def process_pool(processes):
+    # Every worker is forked before this returns, each one held at a barrier
+    # so none can take a second start-up task. Callers create the pool before
+    # starting any threads, so no fork happens while another thread may hold
+    # a lock (logging, numpy, pandas).
+    context = get_context("fork")
+    barrier = context.Barrier(processes, timeout=60)
+    pool = ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=context,
+        initializer=start_worker,
+        initargs=(barrier,),
+    )
+    for future in [pool.submit(wait_for_workers) for _ in range(processes)]:
+        future.result()
+    return pool
+
+
+def irmatable2df(
+    irmaFiles, processes=None, cache_dir=None, min_freq=None, usecols=None, pool=None
+):
+    # With a pool, its workers are shared with the caller's other loaders and
+    # `processes` is only the pool size the work is chunked for
+    if cache_dir is None:
+        reader = partial(irmatable2frame, min_freq=min_freq, usecols=usecols)
+    else:
+        reader = partial(
+            cached_irmatable2frame,
+            cache_dir=cache_dir,
+            min_freq=min_freq,
+            usecols=usecols,
+        )
+    if processes is None:
+        processes = cpu_count() or 1
+    processes = min(processes, len(irmaFiles))
+    if processes > 1:
+        chunksize = max(1, len(irmaFiles) // (processes * 4))
+        if pool is None:
+            with process_pool(processes) as own_pool:
+                frames = list(own_pool.map(reader, irmaFiles, chunksize=chunksize))
+        else:
+            frames = list(pool.map(reader, irmaFiles, chunksize=chunksize))
+    else:
+        frames = [reader(f) for f in irmaFiles]
+    if len(frames) == 0:
+        return pd.DataFrame()
+    return concat_frames(frames)
+
+
+def sample_glob(irma_path, pattern, samples=None):
+    if samples is None:
+        return glob(f"{irma_path}/*/{pattern}")
+    return [f for s in samples for f in glob(f"{irma_path}/{escape(s)}/{pattern}")]
+
+
+def sample_fingerprint(sample_dir):
+    h = sha1(str(irma_parser_version).encode())
+    for f in sorted(glob(sample_dir + "/tables/*") + glob(sample_dir + "/amended_consensus/*")):
+        st = stat(f)
+        h.update(f"{basename(f)}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+def sample_fingerprints(irma_path):
+    fingerprints = {}
+    for tables in glob(irma_path + "/*/tables"):
+        sample_dir = dirname(tables)
+        fingerprints[basename(sample_dir)] = sample_fingerprint(sample_dir)
+    return fingerprints
+
+
+def dash_irma_reads_df(irma_path, samples=None, processes=None, pool=None):
+    readFiles = sample_glob(irma_path, "tables/READ_COUNTS.txt", samples)
     df = pd.DataFrame()
-    df = irmatable2df(readFiles)
+    df = irmatable2df(
+        readFiles,
+        processes=processes,
+        cache_dir=irma_cache_dir(irma_path),
+        pool=pool,
+    )
     df["Stage"] = df["Record"].apply(lambda x: int(x.split("-")[0]))
     return df
 
@@ -136,31 +381,173 @@ def dash_irma_sequence_df(irma_path, amended=True, pad=True):
             sequenceFiles = [i for i in glob(irma_path + "/*/amended_consensus/*fa") if 'pad' not in i]
     else:
         sequenceFiles = [i for i in glob(irma_path + "/*/*fasta") if 'pad' not in i]
-    df = pd.DataFrame(columns=["Sample", "Sequence"])
-    for f in sequenceFiles:
-        content = open(f).read()
-        for s in findall(r">.+", content):
-            sample_id, sequence = s[1:], findall(rf"(?s)(?<={s}).+(?=>)*", content)[0].replace('\n','')
-            df = df.append(pd.DataFrame([[sample_id, sequence]], columns=df.columns))
-    return df
+    records = [record for f in sequenceFiles for record in read_fasta(f)]
+    return pd.DataFrame(records, columns=["Sample", "Sequence"])
 
 
-def dash_irma_coverage_df(irma_path):
-    coverageFiles = glob(irma_path + "/*/tables/*a2m.txt")
+def dash_irma_coverage_df(irma_path, samples=None, processes=None, pool=None):
+    coverageFiles = sample_glob(irma_path, "tables/*a2m.txt", samples)
     # a2msamples = [i.split('/')[-3] for i in coverageFiles]
     # otherFiles = [i for i in glob(irma_path+'/*/tables/*coverage.txt')]
     if len(coverageFiles) == 0:
-        coverageFiles = glob(irma_path + "/*/tables/*coverage.txt")
+        coverageFiles = sample_glob(irma_path, "tables/*coverage.txt", samples)
     if len(coverageFiles) == 0:
         return "No coverage files found under {}/*/tables/".format(irma_path)
-    df = irmatable2df(coverageFiles)
+    df = irmatable2df(
+        coverageFiles,
+        processes=processes,
+        cache_dir=irma_cache_dir(irma_path),
+        pool=pool,
+    )
 
     return df
 
 
-def dash_irma_alleles_df(irma_path, full=False):
-    alleleFiles = glob(irma_path + "/*/tables/*variants.txt")
-    df = irmatable2df(alleleFiles)
+def coverage_headers(df):
+    if "Coverage_Depth" in df.columns:
+        cov_header = "Coverage_Depth"
+    else:
+        cov_header = "Coverage Depth"
+    if "HMM_Position" in df.columns:
+        pos_header = "HMM_Position"
+    else:
+        pos_header = "Position"
+    return pos_header, cov_header
+
+
+def coverage_index(coverage_df):
+    # Sort coverage rows once into contiguous (Sample, Reference_Name) blocks
+    # and record the block offsets, keeping the row order within each block.
+    if len(coverage_df) == 0:
+        return {}
+    pos_header, cov_header = coverage_headers(coverage_df)
+    sample_codes, sample_names = pd.factorize(coverage_df["Sample"])
+    ref_codes, ref_names = pd.factorize(coverage_df["Reference_Name"])
+    sample_names, ref_names = np.asarray(sample_names), np.asarray(ref_names)
+    order = np.lexsort((ref_codes, sample_codes))
+    positions = coverage_df[pos_header].to_numpy()[order]
+    depths = coverage_df[cov_header].to_numpy()[order]
+    covered = ~coverage_df["Consensus"].isin(uncovered_bases).to_numpy()[order]
+    keys = sample_codes[order] * len(ref_names) + ref_codes[order]
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(keys)) + 1])
+    stops = np.concatenate([starts[1:], [len(keys)]])
+    cov_index = {}
+    for key, start, stop in zip(keys[starts], starts, stops):
+        sample = sample_names[key // len(ref_names)]
+        ref = ref_names[key % len(ref_names)]
+        if sample not in cov_index:
+            cov_index[sample] = {"start": start, "refs": {}}
+        cov_index[sample]["stop"] = stop
+        cov_index[sample]["refs"][ref] = (start, stop)
+    for sample_index in cov_index.values():
+        start, stop = sample_index.pop("start"), sample_index["stop"]
+        sample_index["positions"] = positions[start:stop]
+        sample_index["depths"] = depths[start:stop]
+        sample_index["covered"] = covered[start:stop]
+        sample_index["refs"] = {
+            ref: (a - start, b - start) for ref, (a, b) in sample_index["refs"].items()
+        }
+        del sample_index["stop"]
+    return cov_index
+
+
+def bucket_extremes(depths, edges, reduce):
+    bucket_ids = np.repeat(np.arange(len(edges) - 1), np.diff(edges))
+    extremes = reduce.reduceat(depths, edges[:-1])
+    hits = np.flatnonzero(depths == extremes[bucket_ids])
+    _, first = np.unique(bucket_ids[hits], return_index=True)
+    return hits[first]
+
+
+def long_run_edges(mask, width, limit=None):
+    # The points on either side of every run of `mask` at least `width` long;
+    # with a `limit`, only those of the longest runs that fit in it
+    n = len(mask)
+    bounds = np.concatenate([[0], np.flatnonzero(mask[1:] != mask[:-1]) + 1, [n]])
+    starts, stops = bounds[:-1], bounds[1:]
+    runs = np.flatnonzero(mask[starts] & (stops - starts >= width))
+    if limit is not None and 4 * len(runs) > limit:
+        longest = np.argsort(starts[runs] - stops[runs], kind="stable")
+        runs = np.sort(runs[longest[: limit // 4]])
+    edges = np.concatenate(
+        [starts[runs] - 1, starts[runs], stops[runs] - 1, stops[runs]]
+    )
+    return edges[(edges >= 0) & (edges < n)]
+
+
+def decimate_coverage(depths, target, threshold):
+    # Min/max bucketing down to at most `target` points. Zero-coverage gaps of
+    # any length keep the points on either side of them exactly, the longest
+    # first when there are more than half the budget can hold. Dips below
+    # `threshold` keep theirs when at least a bucket wide; shorter ones show
+    # up as their bucket's min. Buckets are made wider until the exact edges
+    # fit the budget.
+    n = len(depths)
+    if target is None or n <= target:
+        return np.arange(n)
+    below, zero = depths < threshold, depths == 0
+    zero_edges = long_run_edges(zero, 1, (target - 2) // 2)
+    buckets = max(1, (target - 2) // 2)
+    while True:
+        exact = np.unique(
+            np.concatenate([long_run_edges(below, n / buckets), zero_edges])
+        )
+        spare = target - 2 - len(exact)
+        if buckets == 1 or 2 * buckets <= spare:
+            break
+        buckets = spare // 2 if spare >= 2 else buckets // 2
+    edges = np.linspace(0, n, buckets + 1).astype(int)
+    keep = np.concatenate(
+        [
+            [0, n - 1],
+            bucket_extremes(depths, edges, np.minimum),
+            bucket_extremes(depths, edges, np.maximum),
+            exact,
+        ]
+    )
+    return np.unique(keep)
+
+
+# Minimum frequencies kept in the alleles and indels tables
+alleles_min_freq = 0.05
+indels_min_freq = 0.2
+# Columns parsed for the dashboard alleles and indels tables
+alleles_cols = [
+    "Reference_Name",
+    "HMM_Position",
+    "Position",
+    "Total",
+    "Consensus_Allele",
+    "Minority_Allele",
+    "Consensus_Count",
+    "Minority_Count",
+    "Minority_Frequency",
+]
+indels_cols = [
+    "Reference_Name",
+    "Upstream_Position",
+    "HMM_Position",
+    "Insert",
+    "Length",
+    "Context",
+    "Count",
+    "Total",
+    "Frequency",
+]
+
+
+def dash_irma_alleles_df(
+    irma_path, full=False, samples=None, min_freq=None, processes=None, pool=None
+):
+    alleleFiles = sample_glob(irma_path, "tables/*variants.txt", samples)
+    df = irmatable2df(
+        alleleFiles,
+        processes=processes,
+        cache_dir=irma_cache_dir(irma_path),
+        min_freq=min_freq,
+        usecols=None if full else alleles_cols,
+        pool=pool,
+    )
     if not full:
         if "HMM_Position" in df.columns:
             ref_heads = [
@@ -201,19 +588,33 @@ def dash_irma_alleles_df(irma_path, full=False):
                 "Minority_Frequency": "Minority Frequency",
             }
         )
-        df["Minority Frequency"] = df[["Minority Frequency"]].applymap(
-            lambda x: float(f"{float(x):.{3}f}")
-        )
     return df
 
 
-def dash_irma_indels_df(irma_path, full=False):
-    insertionFiles = glob(irma_path + "/*/tables/*insertions.txt")
-    deletionFiles = glob(irma_path + "/*/tables/*deletions.txt")
-    idf = irmatable2df(insertionFiles)
+def dash_irma_indels_df(
+    irma_path, full=False, samples=None, min_freq=None, processes=None, pool=None
+):
+    insertionFiles = sample_glob(irma_path, "tables/*insertions.txt", samples)
+    deletionFiles = sample_glob(irma_path, "tables/*deletions.txt", samples)
+    usecols = None if full else indels_cols
+    idf = irmatable2df(
+        insertionFiles,
+        processes=processes,
+        cache_dir=irma_cache_dir(irma_path),
+        min_freq=min_freq,
+        usecols=usecols,
+        pool=pool,
+    )
     idf['Length'] = idf['Insert'].str.len()
-    ddf = irmatable2df(deletionFiles)
-    df = pd.concat([idf, ddf])
+    ddf = irmatable2df(
+        deletionFiles,
+        processes=processes,
+        cache_dir=irma_cache_dir(irma_path),
+        min_freq=min_freq,
+        usecols=usecols,
+        pool=pool,
+    )
+    df = concat_frames([idf, ddf])
     if "HMM_Position" in df.columns:
         df = df.rename(
             columns={
@@ -258,25 +659,147 @@ def dash_irma_indels_df(irma_path, full=False):
                 "Frequency",
             ]
         ]
-    df["Frequency"] = df[["Frequency"]].applymap(lambda x: float(f"{float(x):.{3}f}"))
     return df
 
 
-def reference_lens(irma_path):
-    reffiles = glob(irma_path + "/*/intermediate/0-ITERATIVE-REFERENCES/R0*ref")
+def reference_lens(irma_path, samples=None):
+    # The reference IRMA assembled each sample against; the catalog's module
+    # reference lengths only fill in for references whose R0 file is empty
+    reffiles = sample_glob(
+        irma_path, "intermediate/0-ITERATIVE-REFERENCES/R0*ref", samples
+    )
+    catalog_lens = refcatalog.load_catalog()["ref_lens"]
     ref_lens = {}
     for f in reffiles:
         ref = basename(f)[3:-4]
         if ref not in ref_lens.keys():
-            with open(f, "r") as d:
-                seq = ""
-                for line in d:
-                    if not line[0] == ">":
-                        seq += line.strip()
-            ref_lens[ref] = len(seq)
+            ref_lens[ref] = sum(len(seq) for _, seq in read_fasta(f))
+            if ref_lens[ref] == 0 and ref in catalog_lens:
+                ref_lens[ref] = catalog_lens[ref]
     return ref_lens
 
 
+########### !!! This need to be updated when we add full SC2 genome!
+# Depth statistics are limited to these HMM positions for each virus
+coverage_windows = {"sc2-spike": (21563, 25384)}
+uncovered_bases = ["-", "N", "a", "c", "t", "g"]
+depth_thresholds = [10, 100]
+
+
+def depth_stats(keys, depths):
+    # keys and depths sorted by key, then by depth within each key
+    groups, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+    stats = {
+        "Median Coverage": (
+            depths[starts + (counts - 1) // 2] + depths[starts + counts // 2]
+        )
+        / 2,
+        "Mean Coverage": np.add.reduceat(depths, starts, dtype=np.float64) / counts,
+    }
+    for t in depth_thresholds:
+        stats[f"% Positions >= {t}x"] = (
+            np.add.reduceat(depths >= t, starts, dtype=np.int64) / counts * 100
+        )
+    return groups, stats
+
+
+def coverage_stats(cov_index, ref_lens, virus):
+    # Every per (Sample, Reference) coverage statistic read off the blocks of
+    # a coverage_index(), which the coverage figures share. Covered length and
+    # % covered use the whole reference; depth statistics only use the virus'
+    # window when it has one.
+    stat_cols = [
+        "Covered Length",
+        "% Reference Covered",
+        "Median Coverage",
+        "Mean Coverage",
+    ] + [f"% Positions >= {t}x" for t in depth_thresholds]
+    if len(cov_index) == 0:
+        return pd.DataFrame(columns=["Sample", "Reference"] + stat_cols)
+    window = coverage_windows.get(virus.lower())
+    frames = []
+    for sample, sample_index in cov_index.items():
+        refs = list(sample_index["refs"])
+        bounds = np.array([sample_index["refs"][r] for r in refs])
+        keys = np.repeat(np.arange(len(refs)), bounds[:, 1] - bounds[:, 0])
+        # Blocks tile the sample's arrays in refs order
+        depths, covered = sample_index["depths"], sample_index["covered"]
+        stats_df = pd.DataFrame(
+            {
+                "Sample": sample,
+                "Reference": refs,
+                "Covered Length": np.add.reduceat(
+                    covered, bounds[:, 0], dtype=np.int64
+                ),
+            }
+        )
+        if window is not None:
+            positions = sample_index["positions"]
+            in_window = (positions >= window[0]) & (positions <= window[1])
+            keys, depths = keys[in_window], depths[in_window]
+        order = np.lexsort((depths, keys))
+        window_groups, stats = depth_stats(keys[order], depths[order])
+        for col, values in stats.items():
+            stats_df[col] = np.nan
+            stats_df.loc[window_groups, col] = values
+        frames.append(stats_df)
+    stats_df = pd.concat(frames, ignore_index=True)
+    stats_df["% Reference Covered"] = (
+        stats_df["Covered Length"] / stats_df["Reference"].map(ref_lens) * 100
+    )
+    stats_df = stats_df[["Sample", "Reference"] + stat_cols]
+    return stats_df.sort_values(["Sample", "Reference"]).reset_index(drop=True)
+
+
+summary_metric_cols = [
+    "% Reference Covered",
+    "Median Coverage",
+    "Count of Minor SNVs >= 0.05",
+    "Count of Minor Indels >= 0.05",
+]
+
+
+def summary_metrics(coverage_stats_df, alleles_df, indels_df):
+    indels_df = (
+        indels_df[indels_df["Frequency"] >= 0.05]
+        .groupby(["Sample", "Reference"], observed=True)
+        .agg({"Sample": "count"})
+        .rename(columns={"Sample": "Count of Minor Indels >= 0.05"})
+        .reset_index()
+    )
+    alleles_df = (
+        alleles_df[alleles_df["Minority Frequency"] >= 0.05]
+        .groupby(["Sample", "Reference"], observed=True)
+        .agg({"Sample": "count"})
+        .rename(columns={"Sample": "Count of Minor SNVs >= 0.05"})
+        .reset_index()
+    )
+    coverage_df = coverage_stats_df[
+        ["Sample", "Reference", "% Reference Covered", "Median Coverage"]
+    ].copy()
+    coverage_df["% Reference Covered"] = (
+        coverage_df["% Reference Covered"].map(lambda x: f"{x:.2f}").astype(float)
+    )
+    coverage_df["Median Coverage"] = (
+        coverage_df["Median Coverage"].map(lambda x: f"{x:.0f}").astype(float)
+    )
+    metrics_df = coverage_df
+    for df in [alleles_df, indels_df]:
+        metrics_df = metrics_df.merge(df, how="outer", on=["Sample", "Reference"])
+    return metrics_df[["Sample", "Reference"] + summary_metric_cols]
+
+
+def merge_summary_metrics(reads_df, metrics_df):
+    # Left join each metric on its own so reads rows without that metric get
+    # NaN, and counts keep an integer dtype where every row has one
+    for col in summary_metric_cols:
+        metric_df = metrics_df[["Sample", "Reference", col]].dropna()
+        if col.startswith("Count"):
+            metric_df[col] = metric_df[col].astype(int)
+        reads_df = reads_df.merge(metric_df, "left")
+    return reads_df
+
+
 def returnSegData(df):
     segments = list(df["Reference_Name"].unique())
     try:
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+import json
+from os import getpid, replace
+from os.path import dirname, isdir, realpath
+from sys import argv, exit
+
+import numpy as np
+import pandas as pd
+import yaml
+
+import irma2pandas  # type: ignore
+
+digest_version = 4
+
+
+def digest_path(irma_path, sample):
+    return f"{irma_path}/{sample}.digest.json"
+
+
+def df2records(df):
+    # to_json turns NaN into null and numpy scalars into plain numbers
+    return json.loads(df.to_json(orient="records", double_precision=15))
+
+
+def coverage_trace(cov_index, points, threshold):
+    trace = {}
+    for sample_index in cov_index.values():
+        for ref, (start, stop) in sample_index["refs"].items():
+            depths = sample_index["depths"][start:stop]
+            keep = irma2pandas.decimate_coverage(depths, points, threshold)
+            trace[ref] = {
+                "positions": sample_index["positions"][start:stop][keep].tolist(),
+                "depths": depths[keep].tolist(),
+            }
+    return {"points": points, "threshold": threshold, "refs": trace}
+
+
+def table_record(df):
+    # A dash table's rows as columns plus its dtypes, so the final step can
+    # rebuild the frame exactly as loaded from the IRMA tables
+    dtypes = {col: str(dtype) for col, dtype in df.dtypes.items()}
+    table = json.loads(
+        df.drop(columns="Sample").to_json(
+            orient="split", index=False, double_precision=15
+        )
+    )
+    table["dtypes"] = dtypes
+    return table
+
+
+def table_frame(digest, name):
+    table = digest["tables"][name]
+    df = pd.DataFrame(table["data"], columns=table["columns"])
+    df.insert(loc=0, column="Sample", value=digest["sample"])
+    return df.astype(table["dtypes"])
+
+
+def trace_index(trace):
+    # A coverage_index() entry for the decimated trace, which the coverage
+    # figure draws as is since it is already within the point budget
+    positions, depths, refs = [], [], {}
+    for ref, points in trace["refs"].items():
+        refs[ref] = (len(positions), len(positions) + len(points["positions"]))
+        positions += points["positions"]
+        depths += points["depths"]
+    return {
+        "positions": np.array(positions, dtype=np.int32),
+        "depths": np.array(depths, dtype=np.int32),
+        "refs": refs,
+    }
+
+
+def build_digest(irma_path, sample, virus, points, threshold):
+    digest = {
+        "version": digest_version,
+        "sample": sample,
+        "virus": virus,
+        "fingerprint": None,
+        "tables": {},
+        "ref_lens": {},
+        "coverage_stats": [],
+        "summary": [],
+        "coverage": {},
+    }
+    sample_dir = f"{irma_path}/{sample}"
+    if not isdir(f"{sample_dir}/tables"):
+        return digest
+    digest["fingerprint"] = irma2pandas.sample_fingerprint(sample_dir)
+    samples = [sample]
+    # Digest jobs are single-threaded snakemake jobs, so a sample's few tables
+    # are parsed in this process. The final step takes the sample's dash
+    # tables from here and never parses its IRMA tables again.
+    reads_df = irma2pandas.dash_irma_reads_df(irma_path, samples=samples, processes=1)
+    digest["tables"]["reads"] = table_record(reads_df)
+    coverage_df = irma2pandas.dash_irma_coverage_df(
+        irma_path, samples=samples, processes=1
+    )
+    if isinstance(coverage_df, str):
+        return digest
+    alleles_df = irma2pandas.dash_irma_alleles_df(
+        irma_path, samples=samples, min_freq=irma2pandas.alleles_min_freq, processes=1
+    )
+    indels_df = irma2pandas.dash_irma_indels_df(
+        irma_path, samples=samples, min_freq=irma2pandas.indels_min_freq, processes=1
+    )
+    ref_lens = irma2pandas.reference_lens(irma_path, samples=samples)
+    digest["tables"]["coverage"] = table_record(coverage_df)
+    digest["tables"]["alleles"] = table_record(alleles_df)
+    digest["tables"]["indels"] = table_record(indels_df)
+    digest["ref_lens"] = ref_lens
+    cov_index = irma2pandas.coverage_index(coverage_df)
+    stats_df = irma2pandas.coverage_stats(cov_index, ref_lens, virus)
+    metrics_df = irma2pandas.summary_metrics(stats_df, alleles_df, indels_df)
+    digest["coverage_stats"] = df2records(stats_df.drop(columns="Sample"))
+    digest["summary"] = df2records(metrics_df.drop(columns="Sample"))
+    digest["coverage"] = coverage_trace(cov_index, points, threshold)
+    return digest
+
+
+def write_digest(irma_path, digest):
+    out = digest_path(irma_path, digest["sample"])
+    with open(f"{out}.{getpid()}.tmp", "w") as o:
+        json.dump(digest, o)
+    replace(f"{out}.{getpid()}.tmp", out)
+    return out
+
+
+def load_digests(irma_path, fingerprints, virus):
+    # Only digests built by this version from the sample's current tables
+    # are used; anything else is reduced again from the tables
+    digests = {}
+    for sample, fingerprint in fingerprints.items():
+        try:
+            with open(digest_path(irma_path, sample)) as d:
+                digest = json.load(d)
+        except (FileNotFoundError, ValueError):
+            continue
+        if (
+            digest.get("version") == digest_version
+            and digest.get("fingerprint") == fingerprint
+            and digest.get("virus") == virus
+        ):
+            digests[sample] = digest
+    return digests
+
+
+if __name__ == "__main__":
+    try:
+        irma_path, sample, platform, virus = argv[1], argv[2], argv[3], argv[4]
+    except IndexError:
+        exit(
+            f"\n\tUSAGE: python {__file__} <path/to/irma/results/> <sample> <ont|illumina> <flu|sc2|sc2-spike>\n"
+            f"\n\t\t*Reduces one finished IRMA sample to <path/to/irma/results/>/<sample>.digest.json\n"
+        )
+    with open(
+        dirname(dirname(realpath(__file__)))
+        + "/irma_config/qc_pass_fail_settings.yaml"
+    ) as y:
+        qc_values = yaml.safe_load(y)[f"{platform}-{virus}"]
+    digest = build_digest(
+        irma_path,
+        sample,
+        virus,
+        qc_values.get("coverage_fig_points"),
+        qc_values["med_cov"],
+    )
+    print(f"Digest for {sample} saved to {write_digest(irma_path, digest)}")
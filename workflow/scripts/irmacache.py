@@ -0,0 +1,65 @@
+import pandas as pd
+from glob import glob
+from hashlib import sha1
+from os import getpid, makedirs, remove, replace, stat
+from os.path import abspath, basename
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+def cache_entry(f, cache_dir, version):
+    # Entries are named <path>_<variant>_<fingerprint>: one source table can be
+    # cached under several variants (filters, projections, parser versions) and
+    # only a superseded fingerprint of the same variant is stale
+    st = stat(f)
+    path_key = sha1(abspath(f).encode()).hexdigest()[:16]
+    variant_key = sha1(str(version).encode()).hexdigest()[:16]
+    fingerprint = sha1(f"{st.st_size}|{st.st_mtime_ns}".encode()).hexdigest()
+    variant = f"{path_key}_{variant_key}"
+    return variant, f"{cache_dir}/{variant}_{fingerprint[:16]}.feather"
+
+
+def remove_entry(entry):
+    try:
+        remove(entry)
+    except FileNotFoundError:
+        pass
+
+
+def evict_stale(cache_dir, variant, entry):
+    for stale in glob(f"{cache_dir}/{variant}_*.feather"):
+        if stale != entry:
+            remove_entry(stale)
+
+
+def sweep_missing(cache_dir, sources):
+    # Drop entries whose source table no longer exists, and any left from an
+    # older naming scheme
+    live = {sha1(abspath(f).encode()).hexdigest()[:16] for f in sources}
+    for entry in glob(f"{cache_dir}/*.feather"):
+        keys = basename(entry)[: -len(".feather")].split("_")
+        if len(keys) != 3 or keys[0] not in live:
+            remove_entry(entry)
+
+
+def cached_table(f, parser, cache_dir, version):
+    if pyarrow is None:
+        return parser(f)
+    variant, entry = cache_entry(f, cache_dir, version)
+    try:
+        return pd.read_feather(entry)
+    except (FileNotFoundError, pyarrow.ArrowException):
+        pass
+    df = parser(f)
+    makedirs(cache_dir, exist_ok=True)
+    evict_stale(cache_dir, variant, entry)
+    tmp = f"{entry}.{getpid()}.tmp"
+    try:
+        df.reset_index(drop=True).to_feather(tmp)
+        replace(tmp, entry)
+    except (OSError, ValueError, pyarrow.ArrowException) as E:
+        print(f"could not cache {f}: {E}")
+    return df
@@ -1,30 +1,53 @@
 import pandas as pd
 import numpy
 import json
+from hashlib import sha1
 from sys import argv, path, exit, executable
 import os.path as op
-from os import makedirs
-import plotly.graph_objects as go
+from os import close, cpu_count, listdir, makedirs, remove, replace
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import plotly.express as px
-import plotly.io as pio
 from dash import html
 import yaml
-import time
-from glob import glob
 
 path.append(op.dirname(op.realpath(__file__)))
 import irma2pandas  # type: ignore
 import dais2pandas  # type: ignore
+import dashtables  # type: ignore
+import completion  # type: ignore
+import irma_digest  # type: ignore
+import fastaio  # type: ignore
+import figspec  # type: ignore
+import refcatalog  # type: ignore
 
 try:
     irma_path, samplesheet, platform, virus = argv[1], argv[2], argv[3], argv[4]
 except IndexError:
     exit(
-        f"\n\tUSAGE: python {__file__} <path/to/irma/results/> <samplesheet> <ont|illumina> <flu|sc2|sc2-spike>\n"
+        f"\n\tUSAGE: python {__file__} <path/to/irma/results/> <samplesheet> <ont|illumina> <flu|sc2|sc2-spike> [--incremental] [--workers N] [--watch [--watch-batch N] [--watch-interval SECONDS]]\n"
         f"\n\t\t*Inside path/to/irma/results should be the individual samples-irma-dir results\n"
+        f"\n\t\t*--incremental only rebuilds samples that changed since the last build\n"
+        f"\n\t\t*--workers sets the number of processes rendering per-sample figures\n"
+        f"\n\t\t*--watch updates reads, per-sample coverage tables, heatmap and per-sample figures as each <sample>.irma.fin appears\n"
         f"\n\tYou entered:\n\t{executable} {' '.join(argv)}\n\n"
     )
 
+
+def cli_option(flag, default):
+    try:
+        return type(default)(argv[argv.index(flag, 5) + 1])
+    except (ValueError, IndexError):
+        return default
+
+
+incremental = "--incremental" in argv[5:]
+watch_mode = "--watch" in argv[5:]
+workers = cli_option("--workers", cpu_count() or 1)
+# Process pool shared by the table loaders and the per-sample figures, started
+# in __main__ before any threads
+shared_pool = None
+
 # Load qc config:
 with open(
     op.dirname(op.dirname(op.realpath(__file__)))
@@ -34,45 +57,8 @@ with open(
 
 qc_plat_vir = f"{platform}-{virus}"
 
-proteins = {
-    "sc2": "ORF10 S orf1ab ORF6 ORF8 ORF7a ORF7b M N ORF3a E ORF9b",
-    "flu": "PB1-F2 HA M1 NP HA1 BM2 NB PB2 NEP PB1 HA-signal PA-X NS1 M2 NA PA",
-}
-ref_proteins = {
-    "ORF10": "SARS-CoV-2",
-    "S": "SARS-CoV-2",
-    "orf1ab": "SARS-CoV-2",
-    "ORF6": "SARS-CoV-2",
-    "ORF8": "SARS-CoV-2",
-    "ORF7a": "SARS-CoV-2",
-    "ORF7b": "SARS-CoV-2",
-    "N": "SARS-CoV-2",
-    "ORF3a": "SARS-CoV-2",
-    "E": "SARS-CoV-2",
-    "ORF9b": "SARS-CoV-2",
-    "SARS-CoV-2": "SARS-CoV-2",
-    "PB1-F2": "A_PB1 B_PB1",
-    "HA": "A_HA_H10 A_HA_H11 A_HA_H12 A_HA_H13 A_HA_H14 A_HA_H15 A_HA_H16 A_HA_H1 \
-        A_HA_H2 A_HA_H3 A_HA_H4 A_HA_H5 A_HA_H6 A_HA_H7 A_HA_H8 A_HA_H9 B_HA",
-    "M1": "A_MP B_MP",
-    "NP": "A_NP B_NP",
-    "HA1": "A_HA_H10 A_HA_H11 A_HA_H12 A_HA_H13 A_HA_H14 A_HA_H15 A_HA_H16 A_HA_H1 \
-        A_HA_H2 A_HA_H3 A_HA_H4 A_HA_H5 A_HA_H6 A_HA_H7 A_HA_H8 A_HA_H9 B_HA",
-    "BM2": "B_MP",
-    "NB": "B_MP",
-    "PB2": "A_PB2 B_PB2",
-    "NEP": "A_NS B_NS",
-    "PB1": "A_PB1 B_PB1",
-    "HA-signal": "A_HA_H10 A_HA_H11 A_HA_H12 A_HA_H13 A_HA_H14 A_HA_H15 A_HA_H16 A_HA_H1 \
-        A_HA_H2 A_HA_H3 A_HA_H4 A_HA_H5 A_HA_H6 A_HA_H7 A_HA_H8 A_HA_H9 B_HA",
-    "PA-X": "A_PA B_PA",
-    "NS1": "A_NS B_NS",
-    "NS": "A_NS B_NS",
-    "M2": "A_MP B_MP",
-    "M": "A_MP B_MP SARS-CoV-2",
-    "NA": "A_NA_N1 A_NA_N2 A_NA_N3 A_NA_N4 A_NA_N5 A_NA_N6 A_NA_N7 A_NA_N8 A_NA_N9 B_NA",
-    "PA": "A_PA B_PA",
-}
+catalog = refcatalog.load_catalog()
+ref_proteins = catalog["ref_proteins"]
 
 makedirs(f"{irma_path}/../dash-json", exist_ok=True)
 ###############################################################
@@ -109,29 +95,34 @@ def negative_qc_statement(irma_reads_df, negative_list=""):
     return statement_dic
 
 
-def which_ref(sample, protein, ref_protein_dic, irma_summary_df):
-    try:
-        return list(
-            set(
-                irma_summary_df[irma_summary_df["Sample"] == sample]["Reference"]
-            ).intersection(set(ref_protein_dic[protein].split()))
-        )[0]
-    except IndexError:
-        print(
-            f"no match found for either sample=={sample} in irma_summary_df\n or protein=={protein} in ref_proteins"
-        )
-    except ValueError:
-        return numpy.nan
+def protein_ref_index(ref_protein_dic):
+    return pd.DataFrame(
+        [(p, r) for p, refs in ref_protein_dic.items() for r in refs],
+        columns=["Protein", "Reference"],
+    )
 
 
-def pass_qc(reason, sequence):
-    reason, sequence = str(reason), str(sequence)
-    if reason == "nan" and sequence != "nan":
-        return "Pass"
-    elif reason == "nan" and sequence == "nan":
-        return "No matching reads"
-    else:
-        return reason
+def which_refs(samples, proteins, ref_protein_dic, irma_summary_df):
+    # Resolve the reference of every (sample, protein) pair with two joins:
+    # protein -> candidate references, then sample -> references in the summary
+    keys = pd.DataFrame(
+        {"Sample": list(samples), "Protein": list(proteins), "row": range(len(samples))}
+    )
+    sample_refs = irma_summary_df[["Sample", "Reference"]].drop_duplicates()
+    matched = (
+        keys.merge(protein_ref_index(ref_protein_dic), on="Protein")
+        .merge(sample_refs, on=["Sample", "Reference"])
+        .drop_duplicates(subset="row")
+        .set_index("row")["Reference"]
+        .reindex(range(len(keys)))
+    )
+    if matched.isna().any():
+        missing = keys[matched.isna().to_numpy()]
+        print(
+            f"no reference match found in irma_summary_df or ref_proteins for {len(missing)} (sample, protein) pairs:\n"
+            f"{missing[['Sample', 'Protein']].drop_duplicates().to_string(index=False)}"
+        )
+    return matched.to_numpy()
 
 
 def anyref(ref):
@@ -151,74 +142,86 @@ def failedall(combined_df):
     return combined_df
 
 
+qc_rule_ops = {
+    "<": numpy.less,
+    "<=": numpy.less_equal,
+    ">": numpy.greater,
+    ">=": numpy.greater_equal,
+    "==": numpy.equal,
+}
+
+
+def qc_rule_mask(qc_df, rules, settings):
+    if len(rules) > 32:
+        raise ValueError(f"at most 32 qc_rules are supported, found {len(rules)}")
+    mask = numpy.zeros(len(qc_df), dtype=numpy.uint32)
+    for bit, rule in enumerate(rules):
+        threshold = rule["value"]
+        if isinstance(threshold, str):
+            threshold = settings[threshold]
+        values = pd.to_numeric(qc_df[rule["column"]], errors="coerce").to_numpy(
+            dtype=float
+        )
+        with numpy.errstate(invalid="ignore"):
+            failed = qc_rule_ops[rule["fails_if"]](values, threshold)
+        mask[failed] |= numpy.uint32(1 << bit)
+    return mask
+
+
+def qc_reasons(mask, has_sequence, rules, settings, **fields):
+    reasons = {}
+    for m in numpy.unique(mask):
+        reasons[m] = "; ".join(
+            rule["reason"].format(**settings, **fields)
+            for bit, rule in enumerate(rules)
+            if m & (1 << bit)
+        )
+    rendered = pd.Series(mask).map(reasons)
+    rendered[mask == 0] = numpy.where(
+        has_sequence[mask == 0], "Pass", "No matching reads"
+    )
+    return rendered.to_numpy()
+
+
 def pass_fail_qc_df(irma_summary_df, dais_vars_df, nt_seqs_df):
-    if not qc_values[qc_plat_vir]["allow_stop_codons"]:
+    settings = qc_values[qc_plat_vir]
+    rules = settings["qc_rules"]
+    if not settings["allow_stop_codons"]:
         pre_stop_df = dais_vars_df[dais_vars_df["AA Variants"].str.contains("[0-9]\*")][
             ["Sample", "Protein"]
         ]
     else:
         pre_stop_df = pd.DataFrame(columns=["Sample", "Protein"])
-    pre_stop_df["Reason_a"] = f"Premature stop codon {set(pre_stop_df['Protein'])}"
+    stop_proteins = set(pre_stop_df["Protein"])
     if virus == "flu":
         pre_stop_df["Sample"] = pre_stop_df["Sample"].str[:-2]
-    try:
-        pre_stop_df["Reference"] = pre_stop_df.apply(
-            lambda x: which_ref(
-                x["Sample"], x["Protein"], ref_proteins, irma_summary_df
-            ),
-            axis=1,
-        )
-    except ValueError:
-        pre_stop_df = pd.DataFrame(
-            columns=["Sample", "Protein", "Reference", "Reason_a"]
-        )
-    ref_covered_df = irma_summary_df[
-        (
-            irma_summary_df["% Reference Covered"]
-            < qc_values[qc_plat_vir]["perc_ref_covered"]
-        )
-    ][["Sample", "Reference"]]
-    ref_covered_df[
-        "Reason_b"
-    ] = f"Less than {qc_values[qc_plat_vir]['perc_ref_covered']}% of reference covered"
-    med_cov_df = irma_summary_df[
-        (irma_summary_df["Median Coverage"] < qc_values[qc_plat_vir]["med_cov"])
-    ][["Sample", "Reference"]]
-    med_cov_df["Reason_c"] = f"Median coverage < {qc_values[qc_plat_vir]['med_cov']}"
-    minor_vars_df = irma_summary_df[
-        (
-            irma_summary_df["Count of Minor SNVs >= 0.05"]
-            > qc_values[qc_plat_vir]["minor_vars"]
-        )
-    ][["Sample", "Reference"]]
-    minor_vars_df[
-        "Reason_d"
-    ] = f"Count of minor variants at or over 5% > {qc_values[qc_plat_vir]['minor_vars']}"
-    combined = ref_covered_df.merge(med_cov_df, how="outer", on=["Sample", "Reference"])
-    combined = combined.merge(minor_vars_df, how="outer", on=["Sample", "Reference"])
-    combined = combined.merge(pre_stop_df, how="outer", on=["Sample", "Reference"])
-    combined["Reasons"] = (
-        combined[["Reason_a", "Reason_b", "Reason_c", "Reason_d"]]
-        .fillna("")
-        .agg("; ".join, axis=1)
+    pre_stop_df["Reference"] = which_refs(
+        pre_stop_df["Sample"], pre_stop_df["Protein"], ref_proteins, irma_summary_df
     )
+    pre_stop_df = (
+        pre_stop_df.groupby(["Sample", "Reference"])
+        .size()
+        .rename("Premature Stop Codons")
+        .reset_index()
+    )
+    qc_df = irma_summary_df.merge(pre_stop_df, how="outer", on=["Sample", "Reference"])
+    qc_df["Premature Stop Codons"] = qc_df["Premature Stop Codons"].fillna(0)
+    qc_df["QC Mask"] = qc_rule_mask(qc_df, rules, settings)
+    combined = qc_df.loc[qc_df["QC Mask"] > 0, ["Sample", "Reference", "QC Mask"]]
     # Add in found sequences
-    combined = combined.merge(nt_seqs_df, how="outer", on=["Sample", "Reference"])
-    combined["Reasons"] = combined.apply(
-        lambda x: pass_qc(x["Reasons"], x["Sequence"]), axis=1
+    combined = combined.merge(
+        nt_seqs_df[["Sample", "Reference", "Sequence"]],
+        how="outer",
+        on=["Sample", "Reference"],
+    )
+    combined["Reasons"] = qc_reasons(
+        combined["QC Mask"].fillna(0).to_numpy(dtype=numpy.uint32),
+        combined["Sequence"].notna().to_numpy(),
+        rules,
+        settings,
+        stop_proteins=stop_proteins,
     )
     combined = combined[["Sample", "Reference", "Reasons"]]
-    try:
-        combined["Reasons"] = (
-            combined["Reasons"]
-            .replace("^ \+;|(?<![a-zA_Z0-9]) ;|; \+$", "", regex=True)
-            .str.strip()
-            .replace("^; *| *;$", "", regex=True)
-        )
-    except AttributeError:
-        combined["Reasons"] = combined["Reasons"].fillna(
-            "Too few reads matching reference"
-        )
     # combined = combined.merge(
     #    irma_summary_df["Sample"], how="outer", on="Sample"
     # ).drop_duplicates()
@@ -237,21 +240,14 @@ def pass_fail_qc_df(irma_summary_df, dais_vars_df, nt_seqs_df):
     return combined
 
 
-def perc_len(maplen, ref, ref_lens):
-    return maplen / ref_lens[ref] * 100
-
-
-def irma_summary(
-    irma_path, samplesheet, reads_df, indels_df, alleles_df, coverage_df, ref_lens
-):
+def irma_summary(irma_path, samplesheet, reads_df, metrics_df):
     ss_df = pd.read_csv(samplesheet)
     allsamples_df = (
         ss_df[["Sample ID"]].rename(columns={"Sample ID": "Sample"}).astype(str)
     )
     neg_controls = list(ss_df[ss_df["Sample Type"] == "- Control"]["Sample ID"])
     qc_statement = negative_qc_statement(reads_df, neg_controls)
-    with open(f"{irma_path}/../dash-json/qc_statement.json", "w") as out:
-        json.dump(qc_statement, out)
+    write_json(qc_statement, f"{irma_path}/../dash-json/qc_statement.json")
     reads_df = (
         reads_df[reads_df["Record"].str.contains("^1|^2-p|^4")]
         .pivot("Sample", columns="Record", values="Reads")
@@ -276,56 +272,8 @@ def irma_summary(
     reads_df = reads_df[
         ["Sample", "Total Reads", "Pass QC", "Reads Mapped", "Reference"]
     ]
-    indels_df = (
-        indels_df[indels_df["Frequency"] >= 0.05]
-        .groupby(["Sample", "Reference"])
-        .agg({"Sample": "count"})
-        .rename(columns={"Sample": "Count of Minor Indels >= 0.05"})
-        .reset_index()
-    )
-    alleles_df = (
-        alleles_df[alleles_df["Minority Frequency"] >= 0.05]
-        .groupby(["Sample", "Reference"])
-        .agg({"Sample": "count"})
-        .rename(columns={"Sample": "Count of Minor SNVs >= 0.05"})
-        .reset_index()
-    )
-    cov_ref_lens = (
-        coverage_df[~coverage_df["Consensus"].isin(["-", "N", "a", "c", "t", "g"])]
-        .groupby(["Sample", "Reference_Name"])
-        .agg({"Sample": "count"})
-        .rename(columns={"Sample": "maplen"})
-        .reset_index()
-    )
-    cov_ref_lens["% Reference Covered"] = cov_ref_lens.apply(
-        lambda x: perc_len(x["maplen"], x["Reference_Name"], ref_lens), axis=1
-    )
-    cov_ref_lens["% Reference Covered"] = (
-        cov_ref_lens["% Reference Covered"].map(lambda x: f"{x:.2f}").astype(float)
-    )
-    cov_ref_lens = cov_ref_lens[
-        ["Sample", "Reference_Name", "% Reference Covered"]
-    ].rename(columns={"Reference_Name": "Reference"})
-    ########### !!! This need to be updated when we add full SC2 genome!
-    if virus.lower() == "sc2-spike":
-        coverage_df = coverage_df[coverage_df["HMM_Position"].between(21563, 25384)]
-    coverage_df = (
-        coverage_df.groupby(["Sample", "Reference_Name"])
-        .agg({"Coverage Depth": "median"})
-        .reset_index()
-        .rename(
-            columns={"Coverage Depth": "Median Coverage", "Reference_Name": "Reference"}
-        )
-    )
-    coverage_df["Median Coverage"] = (
-        coverage_df[["Median Coverage"]].applymap(lambda x: f"{x:.0f}").astype(float)
-    )
-    summary_df = (
-        reads_df.merge(cov_ref_lens, "left")
-        .merge(coverage_df, "left")
-        .merge(alleles_df, "left")
-        .merge(indels_df, "left")
-        .merge(allsamples_df, "outer", on="Sample")
+    summary_df = irma2pandas.merge_summary_metrics(reads_df, metrics_df).merge(
+        allsamples_df, "outer", on="Sample"
     )
     summary_df["Reference"] = summary_df["Reference"].fillna("")
     summary_df = summary_df.fillna(0)
@@ -346,11 +294,8 @@ def flu_dais_modifier(vtype_df, dais_seq_df, irma_summary_df):
         lambda x: irma2pandas.flu_segs[vtype_dic[x[:-2]]][x[-1]]
     )
     dais_seq_df["Sample"] = dais_seq_df["Sample"].str[:-2]
-    dais_seq_df["Reference"] = dais_seq_df.apply(
-        lambda x: which_ref(
-            x["Sample"], x["Target_ref"], ref_proteins, irma_summary_df
-        ),
-        axis=1,
+    dais_seq_df["Reference"] = which_refs(
+        dais_seq_df["Sample"], dais_seq_df["Target_ref"], ref_proteins, irma_summary_df
     )
     return dais_seq_df
 
@@ -362,206 +307,475 @@ def noref(ref):
         return ref
 
 
-def generate_dfs(irma_path):
-    print("Building coverage_df")
-    coverage_df = irma2pandas.dash_irma_coverage_df(irma_path)
-    with open(f"{irma_path}/../dash-json/coverage.json", "w") as out:
-        coverage_df.to_json(out, orient="split", double_precision=3)
-        print(f"  -> coverage_df saved to {out.name}")
-    print("Building read_df")
-    read_df = irma2pandas.dash_irma_reads_df(irma_path)
-    with open(f"{irma_path}/../dash-json/reads.json", "w") as out:
-        read_df.to_json(out, orient="split", double_precision=3)
-        print(f"  -> read_df saved to {out.name}")
-    print("Build vtype_df")
-    vtype_df = irma2pandas.dash_irma_sample_type(read_df)
-    # Get most common vtype/sample
-    with open(f"{irma_path}/../dash-json/vtype.json", "w") as out:
-        vtype_df.to_json(out, orient="split", double_precision=3)
-        print(f"  -> vtype_df saved to {out.name}")
-    print("Building alleles_df")
-    alleles_df = irma2pandas.dash_irma_alleles_df(irma_path)
-    alleles_df = alleles_df[alleles_df["Minority Frequency"] >= 0.05]
-    with open(f"{irma_path}/../dash-json/alleles.json", "w") as out:
-        alleles_df.to_json(out, orient="split", double_precision=3)
-        print(f"  -> alleles_df saved to {out.name}")
-    print("Building indels_df")
-    indels_df = irma2pandas.dash_irma_indels_df(irma_path)
-    indels_df = indels_df[indels_df["Frequency"] >= 0.2]
-    with open(f"{irma_path}/../dash-json/indels.json", "w") as out:
-        indels_df.to_json(out, orient="split", double_precision=3)
-        print(f"  -> indels_df saved to {out.name}")
-    print("Building ref_data")
-    ref_lens = irma2pandas.reference_lens(irma_path)
-    segments, segset, segcolor = irma2pandas.returnSegData(coverage_df)
-    with open(f"{irma_path}/../dash-json/ref_data.json", "w") as out:
-        json.dump(
-            {
-                "ref_lens": ref_lens,
-                "segments": segments,
-                "segset": segset,
-                "segcolor": segcolor,
-            },
-            out,
-        )
-        print(f"  -> ref_data saved to {out.name}")
-    print("Building dais_vars_df")
-    # Wait up to 60 seconds for dais_results to be available
-    c = 0
-    while c < 60:
-        if len(glob(f"{irma_path}/dais_results/*seq")) == 0:
-            time.sleep(1)
-        c += 1
-    dais_vars_df = dais2pandas.compute_dais_variants(f"{irma_path}/dais_results")
-    with open(f"{irma_path}/../dash-json/dais_vars.json", "w") as out:
-        dais_vars_df.to_json(out, orient="split", double_precision=3)
-        print(f"  -> dais_vars_df saved to {out.name}")
-    print("Building irma_summary_df")
-    irma_summary_df = irma_summary(
-        irma_path, samplesheet, read_df, indels_df, alleles_df, coverage_df, ref_lens
-    )
-    print("Building nt_sequence_df")
-    nt_seqs_df = irma2pandas.dash_irma_sequence_df(
-        irma_path, pad=qc_values[qc_plat_vir]["padded_consensus"]
+def write_table(df, name, double_precision=3):
+    return dashtables.write_dash_table(
+        df,
+        f"{irma_path}/../dash-json",
+        name,
+        qc_values[qc_plat_vir].get("dash_table_format", "json"),
+        double_precision,
     )
-    if virus == "flu":
-        nt_seqs_df = flu_dais_modifier(vtype_df, nt_seqs_df, irma_summary_df)
-    else:
-        nt_seqs_df = nt_seqs_df.merge(
-            irma_summary_df[["Sample", "Reference"]], how="left", on=["Sample"]
-        )
-    print("Building pass_fail_df")
-    pass_fail_df = pass_fail_qc_df(irma_summary_df, dais_vars_df, nt_seqs_df)
-    with open(f"{irma_path}/../dash-json/pass_fail_qc.json", "w") as out:
-        pass_fail_df.to_json(out, orient="split", double_precision=3)
-        print(f"  -> pass_fail_qc_df saved to {out.name}")
-    pass_fail_seqs_df = (
-        pass_fail_df.reset_index()
-        .melt(id_vars="Sample")
-        .merge(nt_seqs_df, how="left", on=["Sample", "Reference"])
-        .rename(columns={"value": "Reasons"})
-    )
-    # Print nt sequence fastas
-    passed_df = pass_fail_seqs_df.loc[
-        (pass_fail_seqs_df["Reasons"] == "Pass")
-        | (
-            (pass_fail_seqs_df["Reasons"].str.contains("Premature stop codon"))
-            & (~pass_fail_seqs_df["Reasons"].str.contains(";", na=False))
-        )
+
+
+def write_json(obj, path):
+    # Write next to the target and rename over it so the dashboard never
+    # reads a half-written file
+    with open(dashtables.atomic_path(path), "w") as out:
+        json.dump(obj, out)
+    replace(dashtables.atomic_path(path), path)
+
+
+def write_fig(fig, path):
+    figspec.write_figure(fig, path)
+
+
+def write_ref_data(irma_path, ref_lens, segments, segset, segcolor):
+    write_json(
+        {
+            "ref_lens": ref_lens,
+            "segments": segments,
+            "segset": segset,
+            "segcolor": segcolor,
+        },
+        f"{irma_path}/../dash-json/ref_data.json",
+    )
+    print(f"  -> ref_data saved to {irma_path}/../dash-json/ref_data.json")
+
+
+def order_samples(df, samples):
+    # Rows are grouped by sample in the given order, keeping each sample's own
+    # row order, so a spliced table is laid out like a full build
+    if isinstance(df, str) or "Sample" not in df.columns:
+        return df
+    rank = {s: i for i, s in enumerate(samples)}
+    keys = df["Sample"].astype(str).map(rank).fillna(len(rank))
+    return df.iloc[numpy.argsort(keys.to_numpy(), kind="stable")].reset_index(
+        drop=True
+    )
+
+
+def load_sample_tables(name, loader, rebuild, samples):
+    if rebuild is None:
+        return order_samples(loader(irma_path), samples)
+    changed, removed = rebuild
+    previous_df = dashtables.read_dash_table(f"{irma_path}/../dash-json", name)
+    previous_df = previous_df[
+        ~previous_df["Sample"].astype(str).isin(changed + removed)
     ]
-    passed_df.apply(
-        lambda x: seq_df2fastas(
-            irma_path,
-            x["Sample"],
-            x["Reference"],
-            x["Sequence"],
-            "nt",
-            output_name="amended_consensus.fasta",
-        ),
-        axis=1,
-    )
-    failed_df = pass_fail_seqs_df[pass_fail_seqs_df.isin(passed_df) == False].dropna()
-    failed_df["Reasons"] = failed_df["Reasons"].replace(r"\{.+\}", "", regex=True)
-    failed_df.apply(
-        lambda x: seq_df2fastas(
-            irma_path,
-            x["Sample"],
-            x["Reference"],
-            x["Sequence"],
-            "nt",
-            output_name="failed_amended_consensus.fasta",
-            failed_reason=x["Reasons"],
-        ),
-        axis=1,
-    )
-    # Wait up to 60 seconds for dais_results to be available
-    c = 0
-    while c < 60:
-        if len(glob(f"{irma_path}/dais_results/*seq")) == 0:
-            time.sleep(1)
-        c += 1
-    aa_seqs_df = dais2pandas.seq_df(f"{irma_path}/dais_results")
-    if virus == "flu":
-        aa_seqs_df = flu_dais_modifier(vtype_df, aa_seqs_df, irma_summary_df)
-    aa_seqs_df["Reference"] = aa_seqs_df.apply(
-        lambda x: which_ref(x["Sample"], x["Protein"], ref_proteins, irma_summary_df),
-        axis=1,
-    )
-    pass_fail_aa_df = (
-        pass_fail_df.reset_index()
-        .melt(id_vars="Sample")
-        .merge(aa_seqs_df, how="left", on=["Sample", "Reference"])
-        .rename(columns={"value": "Reasons"})
-    )
-    # Print aa sequence fastas
-    passed_df = pass_fail_aa_df.loc[
-        (
-            (pass_fail_aa_df["Reasons"] == "Pass")
+    if len(changed) > 0:
+        previous_df = pd.concat([previous_df, loader(irma_path, samples=changed)])
+    return order_samples(previous_df, samples)
+
+
+def settings_fingerprint():
+    # Per-sample outputs such as the coverage figures' threshold line and
+    # decimation depend on the QC settings as well as the IRMA tables
+    return sha1(
+        json.dumps([qc_plat_vir, qc_values[qc_plat_vir]], sort_keys=True).encode()
+    ).hexdigest()
+
+
+def samples_to_rebuild(irma_path, fingerprints):
+    try:
+        with open(f"{irma_path}/../dash-json/build_manifest.json") as d:
+            previous = json.load(d)
+        for name in ["coverage", "reads", "alleles", "indels"]:
+            if dashtables.dash_table_path(f"{irma_path}/../dash-json", name) is None:
+                raise FileNotFoundError(name)
+    except (FileNotFoundError, ValueError):
+        print("No previous build found, rebuilding all samples")
+        return None
+    if previous.get("settings") != settings_fingerprint():
+        print("QC settings changed since the previous build, rebuilding all samples")
+        return None
+    previous = previous.get("samples", {})
+    changed = [s for s in fingerprints if previous.get(s) != fingerprints[s]]
+    removed = [s for s in previous if s not in fingerprints]
+    print(f"Rebuilding {len(changed)} changed and dropping {len(removed)} removed samples")
+    return changed, removed
+
+
+def write_build_manifest(irma_path, fingerprints):
+    write_json(
+        {"settings": settings_fingerprint(), "samples": fingerprints},
+        f"{irma_path}/../dash-json/build_manifest.json",
+    )
+
+
+def run_task_graph(tasks, max_workers):
+    # tasks maps name -> (function, [dependency names]); each function is called
+    # with its dependencies' results as soon as they are all available
+    results, running = {}, {}
+    pending = dict(tasks)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            for name, (func, deps) in list(pending.items()):
+                if all(d in results for d in deps):
+                    running[pool.submit(func, *[results[d] for d in deps])] = name
+                    del pending[name]
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+    return results
+
+
+def generate_dfs(irma_path, fingerprints, rebuild=None):
+    # The coverage, reads, alleles and indels loaders run at the same time and
+    # parse their tables on the shared process pool
+    def digested_table(name, loader, digests):
+        # Digested samples' rows come straight from their digests; only the
+        # rest are parsed from their IRMA tables
+        def load(irma_path, samples=None):
+            if samples is None:
+                samples = list(fingerprints)
+            frames = [
+                irma_digest.table_frame(digests[s], name)
+                for s in samples
+                if s in digests and name in digests[s]["tables"]
+            ]
+            raw = [s for s in samples if s not in digests]
+            if len(frames) == 0:
+                return loader(irma_path, samples=samples)
+            if len(raw) > 0:
+                raw_df = loader(irma_path, samples=raw)
+                if not isinstance(raw_df, str):
+                    frames.append(raw_df)
+            if len(frames) == 1:
+                return frames[0]
+            return irma2pandas.concat_frames(frames)
+
+        return load
+
+    def coverage(digests):
+        print("Building coverage_df")
+        coverage_df = load_sample_tables(
+            "coverage",
+            digested_table(
+                "coverage",
+                partial(
+                    irma2pandas.dash_irma_coverage_df,
+                    processes=workers,
+                    pool=shared_pool,
+                ),
+                digests,
+            ),
+            rebuild,
+            fingerprints,
+        )
+        saved = write_table(coverage_df, "coverage")
+        print(f"  -> coverage_df saved to {saved}")
+        return coverage_df
+
+    def reads(digests):
+        print("Building read_df")
+        read_df = load_sample_tables(
+            "reads",
+            digested_table(
+                "reads",
+                partial(
+                    irma2pandas.dash_irma_reads_df, processes=workers, pool=shared_pool
+                ),
+                digests,
+            ),
+            rebuild,
+            fingerprints,
+        )
+        saved = write_table(read_df, "reads")
+        print(f"  -> read_df saved to {saved}")
+        return read_df
+
+    def vtype(read_df):
+        print("Build vtype_df")
+        vtype_df = irma2pandas.dash_irma_sample_type(read_df)
+        # Get most common vtype/sample
+        saved = write_table(vtype_df, "vtype")
+        print(f"  -> vtype_df saved to {saved}")
+        return vtype_df
+
+    def alleles(digests):
+        print("Building alleles_df")
+        alleles_df = load_sample_tables(
+            "alleles",
+            digested_table(
+                "alleles",
+                partial(
+                    irma2pandas.dash_irma_alleles_df,
+                    min_freq=irma2pandas.alleles_min_freq,
+                    processes=workers,
+                    pool=shared_pool,
+                ),
+                digests,
+            ),
+            rebuild,
+            fingerprints,
+        )
+        saved = write_table(alleles_df, "alleles")
+        print(f"  -> alleles_df saved to {saved}")
+        return alleles_df
+
+    def indels(digests):
+        print("Building indels_df")
+        indels_df = load_sample_tables(
+            "indels",
+            digested_table(
+                "indels",
+                partial(
+                    irma2pandas.dash_irma_indels_df,
+                    min_freq=irma2pandas.indels_min_freq,
+                    processes=workers,
+                    pool=shared_pool,
+                ),
+                digests,
+            ),
+            rebuild,
+            fingerprints,
+        )
+        saved = write_table(indels_df, "indels")
+        print(f"  -> indels_df saved to {saved}")
+        return indels_df
+
+    def ref_lens(digests):
+        raw = [s for s in fingerprints if s not in digests]
+        ref_lens = irma2pandas.reference_lens(irma_path, samples=raw)
+        for d in digests.values():
+            for ref, length in d["ref_lens"].items():
+                ref_lens.setdefault(ref, length)
+        return ref_lens
+
+    def ref_data(coverage_df, ref_lens):
+        print("Building ref_data")
+        segments, segset, segcolor = irma2pandas.returnSegData(coverage_df)
+        write_ref_data(irma_path, ref_lens, segments, segset, segcolor)
+        return segments, segcolor
+
+    def dais_ready():
+        # Wait up to 60 seconds for DAIS-ribosome to mark its results complete
+        if not completion.wait_for_marker(
+            f"{irma_path}/dais_results", completion.dais_marker, timeout=60
+        ):
+            print(
+                f"  -> no {completion.dais_marker} in {irma_path}/dais_results after 60 seconds,"
+                " reading the results found there"
+            )
+
+    def dais_vars(_):
+        print("Building dais_vars_df")
+        dais_vars_df = dais2pandas.compute_dais_variants(f"{irma_path}/dais_results")
+        saved = write_table(dais_vars_df, "dais_vars")
+        print(f"  -> dais_vars_df saved to {saved}")
+        return dais_vars_df
+
+    def digests():
+        # Samples with a fresh digest from the pipeline were already reduced
+        # right after IRMA; only the rest are reduced here
+        digests = irma_digest.load_digests(irma_path, fingerprints, virus)
+        print(f"  -> {len(digests)} samples have a current digest")
+        return digests
+
+    def digested(digests, key, columns):
+        return pd.DataFrame(
+            [dict(r, Sample=s) for s, d in digests.items() for r in d[key]],
+            columns=columns,
+        )
+
+    def cov_index(coverage_df, digests):
+        # One sort of the coverage rows feeds both the coverage statistics and
+        # the coverage figures; samples drawn from a digest trace are left out
+        traces = current_traces(digests)
+        return irma2pandas.coverage_index(
+            coverage_df[~coverage_df["Sample"].isin(traces)]
+        )
+
+    def cov_stats(cov_index, ref_lens, digests):
+        print("Building coverage_stats_df")
+        stats_df = irma2pandas.coverage_stats(
+            {s: i for s, i in cov_index.items() if s not in digests}, ref_lens, virus
+        )
+        stats_df = pd.concat(
+            [digested(digests, "coverage_stats", stats_df.columns), stats_df]
+        )
+        stats_df = stats_df.sort_values(["Sample", "Reference"]).reset_index(drop=True)
+        saved = write_table(stats_df, "coverage_stats")
+        print(f"  -> coverage_stats_df saved to {saved}")
+        return stats_df
+
+    def metrics(stats_df, alleles_df, indels_df, digests):
+        computed_df = irma2pandas.summary_metrics(
+            stats_df[~stats_df["Sample"].isin(digests)],
+            alleles_df[~alleles_df["Sample"].isin(digests)],
+            indels_df[~indels_df["Sample"].isin(digests)],
+        )
+        digested_df = digested(digests, "summary", computed_df.columns).astype(
+            {col: float for col in irma2pandas.summary_metric_cols}
+        )
+        return pd.concat([digested_df, computed_df])
+
+    def summary(read_df, metrics_df):
+        print("Building irma_summary_df")
+        return irma_summary(irma_path, samplesheet, read_df, metrics_df)
+
+    def nt_seqs(vtype_df, irma_summary_df):
+        print("Building nt_sequence_df")
+        nt_seqs_df = irma2pandas.dash_irma_sequence_df(
+            irma_path, pad=qc_values[qc_plat_vir]["padded_consensus"]
+        )
+        if virus == "flu":
+            nt_seqs_df = flu_dais_modifier(vtype_df, nt_seqs_df, irma_summary_df)
+        else:
+            nt_seqs_df = nt_seqs_df.merge(
+                irma_summary_df[["Sample", "Reference"]], how="left", on=["Sample"]
+            )
+        saved = write_table(nt_seqs_df, "nt_sequences", double_precision=None)
+        print(f"  -> nt_sequence_df saved to {saved}")
+        return nt_seqs_df
+
+    def aa_seqs(_, vtype_df, irma_summary_df):
+        aa_seqs_df = dais2pandas.seq_df(f"{irma_path}/dais_results")
+        if virus == "flu":
+            aa_seqs_df = flu_dais_modifier(vtype_df, aa_seqs_df, irma_summary_df)
+        aa_seqs_df["Reference"] = which_refs(
+            aa_seqs_df["Sample"], aa_seqs_df["Protein"], ref_proteins, irma_summary_df
+        )
+        return aa_seqs_df
+
+    def pass_fail(irma_summary_df, dais_vars_df, nt_seqs_df):
+        print("Building pass_fail_df")
+        pass_fail_df = pass_fail_qc_df(irma_summary_df, dais_vars_df, nt_seqs_df)
+        saved = write_table(pass_fail_df, "pass_fail_qc")
+        print(f"  -> pass_fail_qc_df saved to {saved}")
+        return pass_fail_df
+
+    def nt_fastas(pass_fail_df, nt_seqs_df):
+        pass_fail_seqs_df = (
+            pass_fail_df.reset_index()
+            .melt(id_vars="Sample")
+            .merge(nt_seqs_df, how="left", on=["Sample", "Reference"])
+            .rename(columns={"value": "Reasons"})
+        )
+        # Print nt sequence fastas
+        passed_df = pass_fail_seqs_df.loc[
+            (pass_fail_seqs_df["Reasons"] == "Pass")
             | (
-                (pass_fail_aa_df["Reasons"].str.contains("Premature stop codon"))
-                & (~pass_fail_aa_df["Reasons"].str.contains(";", na=False))
+                (pass_fail_seqs_df["Reasons"].str.contains("Premature stop codon"))
+                & (~pass_fail_seqs_df["Reasons"].str.contains(";", na=False))
             )
+        ]
+        seq_df2fasta(
+            irma_path,
+            passed_df,
+            "Reference",
+            "Sequence",
+            "amended_consensus.fasta",
         )
-    ]
-    passed_df.apply(
-        lambda x: seq_df2fastas(
+        failed_df = pass_fail_seqs_df[
+            pass_fail_seqs_df.isin(passed_df) == False
+        ].dropna()
+        failed_df["Reasons"] = failed_df["Reasons"].replace(r"\{.+\}", "", regex=True)
+        seq_df2fasta(
+            irma_path,
+            failed_df,
+            "Reference",
+            "Sequence",
+            "failed_amended_consensus.fasta",
+            failed=True,
+        )
+
+    def aa_fastas(pass_fail_df, aa_seqs_df):
+        pass_fail_aa_df = (
+            pass_fail_df.reset_index()
+            .melt(id_vars="Sample")
+            .merge(aa_seqs_df, how="left", on=["Sample", "Reference"])
+            .rename(columns={"value": "Reasons"})
+        )
+        # Print aa sequence fastas
+        passed_df = pass_fail_aa_df.loc[
+            (
+                (pass_fail_aa_df["Reasons"] == "Pass")
+                | (
+                    (pass_fail_aa_df["Reasons"].str.contains("Premature stop codon"))
+                    & (~pass_fail_aa_df["Reasons"].str.contains(";", na=False))
+                )
+            )
+        ]
+        seq_df2fasta(
             irma_path,
-            x["Sample"],
-            x["Protein"],
-            x["AA Sequence"],
-            "aa",
-            output_name="amino_acid_consensus.fasta",
-        ),
-        axis=1,
-    )
-    failed_df = pass_fail_aa_df[pass_fail_aa_df.isin(passed_df) == False].dropna()
-    failed_df["Reasons"] = failed_df["Reasons"].replace(r"\{.+\}", "", regex=True)
-    failed_df.apply(
-        lambda x: seq_df2fastas(
+            passed_df,
+            "Protein",
+            "AA Sequence",
+            "amino_acid_consensus.fasta",
+        )
+        failed_df = pass_fail_aa_df[pass_fail_aa_df.isin(passed_df) == False].dropna()
+        failed_df["Reasons"] = failed_df["Reasons"].replace(r"\{.+\}", "", regex=True)
+        seq_df2fasta(
             irma_path,
-            x["Sample"],
-            x["Protein"],
-            x["AA Sequence"],
-            "aa",
-            output_name="failed_amino_acid_consensus.fasta",
-            failed_reason=x["Reasons"],
-        ),
-        axis=1,
-    )
-    with open(f"{irma_path}/../dash-json/nt_sequences.json", "w") as out:
-        nt_seqs_df.to_json(out, orient="split")
-        print(f"  -> nt_sequence_df saved to {out.name}")
-    irma_summary_df = irma_summary_df.merge(
-        pass_fail_df.reset_index().melt(id_vars=["Sample"], value_name="Reasons"),
-        how="left",
-        on=["Sample", "Reference"],
+            failed_df,
+            "Protein",
+            "AA Sequence",
+            "failed_amino_acid_consensus.fasta",
+            failed=True,
+        )
+
+    def summary_table(irma_summary_df, pass_fail_df):
+        irma_summary_df = irma_summary_df.merge(
+            pass_fail_df.reset_index().melt(id_vars=["Sample"], value_name="Reasons"),
+            how="left",
+            on=["Sample", "Reference"],
+        )
+        irma_summary_df["Reference"] = irma_summary_df["Reference"].apply(
+            lambda x: noref(x)
+        )
+        irma_summary_df["Reasons"] = irma_summary_df["Reasons"].fillna("Fail")
+        irma_summary_df = irma_summary_df.rename(
+            columns={"Reasons": "Pass/Fail Reason"}
+        )
+        saved = write_table(irma_summary_df, "irma_summary")
+        print(f"  -> irma_summary_df saved to {saved}")
+
+    results = run_task_graph(
+        {
+            "coverage": (coverage, ["digests"]),
+            "reads": (reads, ["digests"]),
+            "alleles": (alleles, ["digests"]),
+            "indels": (indels, ["digests"]),
+            "ref_lens": (ref_lens, ["digests"]),
+            "dais_ready": (dais_ready, []),
+            "vtype": (vtype, ["reads"]),
+            "ref_data": (ref_data, ["coverage", "ref_lens"]),
+            "dais_vars": (dais_vars, ["dais_ready"]),
+            "digests": (digests, []),
+            "cov_index": (cov_index, ["coverage", "digests"]),
+            "cov_stats": (cov_stats, ["cov_index", "ref_lens", "digests"]),
+            "metrics": (metrics, ["cov_stats", "alleles", "indels", "digests"]),
+            "summary": (summary, ["reads", "metrics"]),
+            "nt_seqs": (nt_seqs, ["vtype", "summary"]),
+            "aa_seqs": (aa_seqs, ["dais_ready", "vtype", "summary"]),
+            "pass_fail": (pass_fail, ["summary", "dais_vars", "nt_seqs"]),
+            "nt_fastas": (nt_fastas, ["pass_fail", "nt_seqs"]),
+            "aa_fastas": (aa_fastas, ["pass_fail", "aa_seqs"]),
+            "summary_table": (summary_table, ["summary", "pass_fail"]),
+        },
+        max_workers=workers,
     )
-    irma_summary_df["Reference"] = irma_summary_df["Reference"].apply(
-        lambda x: noref(x)
+    segments, segcolor = results["ref_data"]
+    return (
+        results["reads"],
+        results["cov_index"],
+        results["cov_stats"],
+        segments,
+        segcolor,
+        results["pass_fail"],
+        results["digests"],
     )
-    irma_summary_df["Reasons"] = irma_summary_df["Reasons"].fillna("Fail")
-    irma_summary_df = irma_summary_df.rename(columns={"Reasons": "Pass/Fail Reason"})
-    with open(f"{irma_path}/../dash-json/irma_summary.json", "w") as out:
-        irma_summary_df.to_json(out, orient="split", double_precision=3)
-        print(f"  -> irma_summary_df saved to {out.name}")
-    return read_df, coverage_df, segments, segcolor, pass_fail_df
 
 
-def seq_df2fastas(
-    irma_path,
-    sample,
-    reference,
-    sequence,
-    nt_or_aa,
-    output_name=False,
-    failed_reason="",
-):
-    if not output_name:
-        output_name = f"{nt_or_aa}_{sample}_{reference}.fasta"
-    if failed_reason != "":
-        failed_reason = f"|{failed_reason}"
-    with open(f"{irma_path}/../{output_name}", "a+") as out:
-        print(f">{sample}|{reference}{failed_reason}\n{sequence}", file=out)
+def seq_df2fasta(irma_path, seq_df, ref_col, seq_col, output_name, failed=False):
+    headers = seq_df["Sample"].astype(str) + "|" + seq_df[ref_col].astype(str)
+    if failed:
+        headers = headers + "|" + seq_df["Reasons"].astype(str)
+    fastaio.write_fasta(
+        f"{irma_path}/../{output_name}",
+        zip(headers, seq_df[seq_col].astype(str)),
+    )
 
 
 ###################################################################
@@ -569,15 +783,13 @@ def seq_df2fastas(
 ###################################################################
 
 
-def pivot4heatmap(coverage_df):
-    if "Coverage_Depth" in coverage_df.columns:
-        cov_header = "Coverage_Depth"
-    else:
-        cov_header = "Coverage Depth"
-    if virus.lower() == "sc2-spike":
-        coverage_df = coverage_df[coverage_df["HMM_Position"].between(21563, 25384)]
-    df2 = coverage_df[["Sample", "Reference_Name", cov_header]]
-    df3 = df2.groupby(["Sample", "Reference_Name"]).median().reset_index()
+def pivot4heatmap(coverage_stats_df):
+    cov_header = "Coverage Depth"
+    df3 = (
+        coverage_stats_df[["Sample", "Reference", "Median Coverage"]]
+        .dropna()
+        .rename(columns={"Reference": "Reference_Name", "Median Coverage": cov_header})
+    )
     try:
         df3[["Subtype", "Segment", "Group"]] = df3["Reference_Name"].str.split(
             "_", expand=True
@@ -606,21 +818,26 @@ def createheatmap(irma_path, coverage_medians_df):
         cov_max = 200
     elif cov_max >= 1000:
         cov_max = 1000
-    fig = go.Figure(
-        data=go.Heatmap(  # px.imshow(df5
-            x=list(coverage_medians_df["Sample"]),
-            y=list(coverage_medians_df["Segment"]),
-            z=list(coverage_medians_df[cov_header]),
-            zmin=0,
-            zmid=100,
-            zmax=cov_max,
-            colorscale="gnbu",
-            hovertemplate="%{y} = %{z:,.0f}x<extra>%{x}<br></extra>",
-        )
-    )
-    fig.update_layout(legend=dict(x=0.4, y=1.2, orientation="h"))
-    fig.update_xaxes(side="top")
-    pio.write_json(fig, f"{irma_path}/../dash-json/heatmap.json")
+    fig = figspec.figure(
+        [
+            {
+                "colorscale": figspec.colorscale("gnbu"),
+                "hovertemplate": "%{y} = %{z:,.0f}x<extra>%{x}<br></extra>",
+                "x": list(coverage_medians_df["Sample"]),
+                "y": list(coverage_medians_df["Segment"]),
+                "z": list(coverage_medians_df[cov_header]),
+                "zmax": cov_max,
+                "zmid": 100,
+                "zmin": 0,
+                "type": "heatmap",
+            }
+        ],
+        {
+            "legend": {"x": 0.4, "y": 1.2, "orientation": "h"},
+            "xaxis": {"side": "top"},
+        },
+    )
+    write_fig(fig, f"{irma_path}/../dash-json/heatmap.json")
     print(f"  -> coverage heatmap json saved to {irma_path}/../dash-json/heatmap.json")
 
 
@@ -666,179 +883,381 @@ def create_passfail_heatmap(irma_path, pass_fail_df):
     pass_fail_df = pass_fail_df.dropna()
     pass_fail_df["Number"] = pass_fail_df["Reasons"].apply(lambda x: assign_number(x))
     pass_fail_df["Reasons"].fillna("No assembly")
-    fig = go.Figure(
-        data=go.Heatmap(
-            x=list(pass_fail_df["Sample"]),
-            y=list(pass_fail_df["Reference"]),
-            z=list(pass_fail_df["Number"]),
-            customdata=list(pass_fail_df["Reasons"]),
-            zmin=-4,
-            zmax=6,
-            zmid=1,
-            colorscale="blackbody_r",  # 'ylorrd',
-            hovertemplate="%{x}<br>%{customdata}<extra>%{y}<br></extra>",
-        )
-    )
-    fig.update_xaxes(side="top")
-    fig.update_traces(showscale=False)
-    fig.update_layout(paper_bgcolor="white", plot_bgcolor="white")
-    pio.write_json(fig, f"{irma_path}/../dash-json/pass_fail_heatmap.json")
+    fig = figspec.figure(
+        [
+            {
+                "colorscale": figspec.colorscale("blackbody_r"),  # 'ylorrd',
+                "customdata": list(pass_fail_df["Reasons"]),
+                "hovertemplate": "%{x}<br>%{customdata}<extra>%{y}<br></extra>",
+                "x": list(pass_fail_df["Sample"]),
+                "y": list(pass_fail_df["Reference"]),
+                "z": list(pass_fail_df["Number"]),
+                "zmax": 6,
+                "zmid": 1,
+                "zmin": -4,
+                "showscale": False,
+                "type": "heatmap",
+            }
+        ],
+        {
+            "xaxis": {"side": "top"},
+            "paper_bgcolor": "white",
+            "plot_bgcolor": "white",
+        },
+    )
+    write_fig(fig, f"{irma_path}/../dash-json/pass_fail_heatmap.json")
     print(
         f"  -> pass_fail heatmap json saved to {irma_path}/../dash-json/pass_fail_heatmap.json"
     )
 
 
-def createsankey(irma_path, read_df, virus):
+def render_sample_figs(render, jobs):
+    if shared_pool is not None and len(jobs) > 1:
+        for future in [shared_pool.submit(render, *job) for job in jobs]:
+            future.result()
+    else:
+        for job in jobs:
+            render(*job)
+
+
+def write_sankey_fig(irma_path, sample, sample_read_df, virus):
+    sankeyfig = irma2pandas.dash_reads_to_sankey(sample_read_df, virus)
+    write_fig(sankeyfig, f"{irma_path}/../dash-json/readsfig_{sample}.json")
+    print(
+        f"  -> read sankey plot json saved to {irma_path}/../dash-json/readsfig_{sample}.json"
+    )
+
+
+def createsankey(irma_path, read_df, virus, samples=None):
     print(f"Building read sankey plot")
-    for sample in read_df["Sample"].unique():
-        sankeyfig = irma2pandas.dash_reads_to_sankey(
-            read_df[read_df["Sample"] == sample], virus
-        )
-        pio.write_json(sankeyfig, f"{irma_path}/../dash-json/readsfig_{sample}.json")
-        print(
-            f"  -> read sankey plot json saved to {irma_path}/../dash-json/readsfig_{sample}.json"
-        )
+    sample_read_dfs = dict(tuple(read_df.groupby("Sample", sort=False)))
+    if samples is None:
+        samples = list(sample_read_dfs.keys())
+    else:
+        samples = [s for s in samples if s in sample_read_dfs]
+    render_sample_figs(
+        write_sankey_fig,
+        [(irma_path, s, sample_read_dfs[s], virus) for s in samples],
+    )
 
 
 def createReadPieFigure(irma_path, read_df):
     print(f"Building barcode distribution pie figure")
     read_df = read_df[read_df["Record"] == "1-initial"]
-    fig = px.pie(read_df, values="Reads", names="Sample")
-    fig.update_traces(textposition="inside", textinfo="percent+label")
-    fig.write_json(f"{irma_path}/../dash-json/barcode_distribution.json")
+    # Same trace px.pie(read_df, values="Reads", names="Sample") builds
+    fig = figspec.figure(
+        [
+            {
+                "domain": {"x": [0.0, 1.0], "y": [0.0, 1.0]},
+                "hovertemplate": "Sample=%{label}<br>Reads=%{value}<extra></extra>",
+                "labels": list(read_df["Sample"]),
+                "legendgroup": "",
+                "name": "",
+                "showlegend": True,
+                "values": list(read_df["Reads"]),
+                "type": "pie",
+                "textinfo": "percent+label",
+                "textposition": "inside",
+            }
+        ],
+        {"legend": {"tracegroupgap": 0}, "margin": {"t": 60}},
+    )
+    write_fig(fig, f"{irma_path}/../dash-json/barcode_distribution.json")
     print(
         f"  -> barcode distribution pie figure saved to {irma_path}/../dash-json/barcode_distribution.json"
     )
 
 
-def zerolift(x):
-    if x == 0:
-        return 0.000000000001
-    return x
+def zerolift(depths):
+    return numpy.where(depths == 0, 0.000000000001, depths)
 
 
-def createSampleCoverageFig(sample, df, segments, segcolor, cov_linear_y):
-    if "Coverage_Depth" in df.columns:
-        cov_header = "Coverage_Depth"
-    else:
-        cov_header = "Coverage Depth"
-    if "HMM_Position" in df.columns:
-        pos_header = "HMM_Position"
-    else:
-        pos_header = "Position"
+def createSampleCoverageFig(sample, sample_index, segments, segcolor, cov_linear_y):
+    positions, depths = sample_index["positions"], sample_index["depths"]
     if not cov_linear_y:
-        df[cov_header] = df[cov_header].apply(lambda x: zerolift(x))
-    df2 = df[df["Sample"] == sample]
-    fig = go.Figure()
+        depths = zerolift(depths)
+    data = []
     if "SARS-CoV-2" in segments:
         # y positions for gene boxes
-        oy = (
-            max(df2[cov_header]) / 10
+        oy = float(
+            depths.max() / 10
         )  # This value determines where the top of the ORF box is drawn against the y-axis
-        if not cov_linear_y:
-            ya = 0.9
-        else:
-            ya = 0 - (max(df2[cov_header]) / 20)
-        orf_pos = {
-            "orf1ab": (266, 21556),
-            "S": [21563, 25385],
-            "ORF3a": [25393, 26221],
-            "E": [26245, 26473],
-            "M": [26523, 27192],
-            "ORF6": [27202, 27388],
-            "ORF7a": [27394, 27759],
-            "ORF7b": [27756, 27887],
-            "ORF8": [27894, 28260],
-            "N": [28274, 29534],
-            "ORF10": [29558, 29675],
-            "ORF9b": [28284, 28577],
-        }
+        orf_pos = catalog["orf_pos"]
         color_index = 0
         print(orf_pos)
         for orf, pos in orf_pos.items():
-            fig.add_trace(
-                go.Scatter(
-                    x=[pos[0], pos[1], pos[1], pos[0], pos[0]],
-                    y=[oy, oy, 0, 0, oy],
-                    fill="toself",
-                    fillcolor=px.colors.qualitative.Set3[color_index],
-                    line=dict(color=px.colors.qualitative.Set3[color_index]),
-                    mode="lines",
-                    name=orf,
-                    opacity=0.8,
-                )
+            data.append(
+                {
+                    "fill": "toself",
+                    "fillcolor": px.colors.qualitative.Set3[color_index],
+                    "line": {"color": px.colors.qualitative.Set3[color_index]},
+                    "mode": "lines",
+                    "name": orf,
+                    "opacity": 0.8,
+                    "x": [pos[0], pos[1], pos[1], pos[0], pos[0]],
+                    "y": [oy, oy, 0, 0, oy],
+                    "type": "scatter",
+                }
             )
             color_index += 1
     for g in segments:
-        if g in df2["Reference_Name"].unique():
+        if g in sample_index["refs"]:
             try:
                 g_base = g.split("_")[1]
             except IndexError:
                 g_base = g
-            df3 = df2[df2["Reference_Name"] == g]
-            fig.add_trace(
-                go.Scatter(
-                    x=df3[pos_header],
-                    y=df3[cov_header],
-                    mode="lines",
-                    line=go.scatter.Line(color=segcolor[g_base]),
-                    name=g,
-                    customdata=tuple(["all"] * len(df3["Sample"])),
-                )
+            start, stop = sample_index["refs"][g]
+            keep = irma2pandas.decimate_coverage(
+                sample_index["depths"][start:stop],
+                qc_values[qc_plat_vir].get("coverage_fig_points"),
+                qc_values[qc_plat_vir]["med_cov"],
+            )
+            data.append(
+                {
+                    "customdata": ["all"] * len(keep),
+                    "line": {"color": segcolor[g_base]},
+                    "mode": "lines",
+                    "name": g,
+                    "x": positions[start:stop][keep],
+                    "y": depths[start:stop][keep],
+                    "type": "scatter",
+                }
             )
-    fig.add_shape(
-        type="line",
-        x0=0,
-        x1=df2[pos_header].max(),
-        y0=qc_values[qc_plat_vir]["med_cov"],
-        y1=qc_values[qc_plat_vir]["med_cov"],
-        line=dict(color="Black", dash="dash", width=5),
-    )
-    ymax = df2[cov_header].max()
+    ymax = depths.max()
     if not cov_linear_y:
         ya_type = "log"
         ymax = ymax ** (1 / 10)
     else:
         ya_type = "linear"
-    fig.update_layout(
-        height=600,
-        title=sample,
-        yaxis_title="Coverage",
-        xaxis_title="Reference Position",
-        yaxis_type=ya_type,
-        yaxis_range=[0, ymax],
+    return figspec.figure(
+        data,
+        {
+            "shapes": [
+                {
+                    "line": {"color": "Black", "dash": "dash", "width": 5},
+                    "type": "line",
+                    "x0": 0,
+                    "x1": positions.max(),
+                    "y0": qc_values[qc_plat_vir]["med_cov"],
+                    "y1": qc_values[qc_plat_vir]["med_cov"],
+                }
+            ],
+            "height": 600,
+            "title": {"text": sample},
+            "xaxis": {"title": {"text": "Reference Position"}},
+            "yaxis": {
+                "title": {"text": "Coverage"},
+                "type": ya_type,
+                "range": [0, ymax],
+            },
+        },
     )
-    return fig
 
 
-def createcoverageplot(irma_path, coverage_df, segments, segcolor):
-    samples = coverage_df["Sample"].unique()
+def write_coverage_fig(irma_path, sample, sample_index, segments, segcolor):
+    coveragefig = createSampleCoverageFig(
+        sample, sample_index, segments, segcolor, True
+    )
+    write_fig(
+        coveragefig, f"{irma_path}/../dash-json/coveragefig_{sample}_linear.json"
+    )
+    print(f"  -> saved {irma_path}/../dash-json/coveragefig_{sample}_linear.json")
+
+
+def createcoverageplot(irma_path, cov_index, segments, segcolor, samples=None):
+    if samples is None:
+        samples = list(cov_index.keys())
+    else:
+        samples = [s for s in samples if s in cov_index]
     print(f"Building coverage plots for {len(samples)} samples")
-    for sample in samples:
-        coveragefig = createSampleCoverageFig(
-            sample, coverage_df, segments, segcolor, True
-        )
-        pio.write_json(
-            coveragefig, f"{irma_path}/../dash-json/coveragefig_{sample}_linear.json"
-        )
-        print(f"  -> saved {irma_path}/../dash-json/coveragefig_{sample}_linear.json")
-        # coveragefig = createSampleCoverageFig(
-        #    sample, coverage_df, segments, segcolor, True
-        # )
-        # pio.write_json(
-        #    coveragefig, f"{irma_path}/../dash-json/coveragefig_{sample}_log.json"
-        # )
-        # print(f"  -> saved {irma_path}/../dash-json/coveragefig_{sample}_log.json")
+    render_sample_figs(
+        write_coverage_fig,
+        [(irma_path, s, cov_index[s], segments, segcolor) for s in samples],
+    )
     print(f" --> All coverage jsons saved")
 
 
-def generate_figs(irma_path, read_df, coverage_df, segments, segcolor, pass_fail_df):
+def remove_sample_figs(irma_path, samples):
+    for sample in samples:
+        for fig in [f"coveragefig_{sample}_linear.json", f"readsfig_{sample}.json"]:
+            try:
+                remove(f"{irma_path}/../dash-json/{fig}")
+                print(f"  -> removed {irma_path}/../dash-json/{fig}")
+            except FileNotFoundError:
+                pass
+
+
+def current_traces(digests):
+    # Digest coverage traces decimated with the current settings, which the
+    # coverage figures are drawn from as they are
+    return {
+        s: d["coverage"]
+        for s, d in digests.items()
+        if d["coverage"].get("points")
+        == qc_values[qc_plat_vir].get("coverage_fig_points")
+        and d["coverage"].get("threshold") == qc_values[qc_plat_vir]["med_cov"]
+        and len(d["coverage"].get("refs", {})) > 0
+    }
+
+
+def generate_figs(
+    irma_path,
+    read_df,
+    cov_index,
+    coverage_stats_df,
+    segments,
+    segcolor,
+    pass_fail_df,
+    digests,
+    rebuild=None,
+):
+    if rebuild is None:
+        samples = None
+    else:
+        samples, removed = rebuild
+        remove_sample_figs(irma_path, removed)
     createReadPieFigure(irma_path, read_df)
-    createsankey(irma_path, read_df, virus)
-    createheatmap(irma_path, pivot4heatmap(coverage_df))
+    createsankey(irma_path, read_df, virus, samples)
+    createheatmap(irma_path, pivot4heatmap(coverage_stats_df))
     create_passfail_heatmap(irma_path, pass_fail_df)
-    createcoverageplot(irma_path, coverage_df, segments, segcolor)
+    cov_index = dict(cov_index)
+    cov_index.update(
+        {s: irma_digest.trace_index(t) for s, t in current_traces(digests).items()}
+    )
+    createcoverageplot(irma_path, cov_index, segments, segcolor, samples)
+
+
+def finished_samples(irma_path):
+    return sorted(
+        f[: -len(".irma.fin")] for f in listdir(irma_path) if f.endswith(".irma.fin")
+    )
+
+
+def replace_samples(df, samples, new_df):
+    if df is None:
+        return new_df
+    return irma2pandas.concat_frames([df[~df["Sample"].isin(samples)], new_df])
+
+
+def live_update(irma_path, live, samples):
+    # Only the newly finished samples' tables are loaded and only their
+    # coverage shards and figures are written; the reads and coverage tables,
+    # pie and heatmap are rebuilt from the frames kept between updates
+    read_df = irma2pandas.dash_irma_reads_df(
+        irma_path, samples=samples, processes=workers, pool=shared_pool
+    )
+    live["reads"] = replace_samples(live["reads"], samples, read_df)
+    saved = write_table(live["reads"], "reads")
+    print(f"  -> read_df saved to {saved}")
+    createReadPieFigure(irma_path, live["reads"])
+    createsankey(irma_path, read_df, virus)
+    coverage_df = irma2pandas.dash_irma_coverage_df(
+        irma_path, samples=samples, processes=workers, pool=shared_pool
+    )
+    if isinstance(coverage_df, str):
+        return
+    # Coverage is written per sample so each update costs only its own samples
+    saved = dashtables.write_dash_shards(
+        coverage_df,
+        f"{irma_path}/../dash-json",
+        "coverage_shards",
+        "Sample",
+        qc_values[qc_plat_vir].get("dash_table_format", "json"),
+    )
+    print(f"  -> coverage for {', '.join(samples)} saved to {saved}")
+    live["coverage"] = replace_samples(live["coverage"], samples, coverage_df)
+    saved = write_table(live["coverage"], "coverage")
+    print(f"  -> coverage_df saved to {saved}")
+    live["ref_lens"].update(irma2pandas.reference_lens(irma_path, samples=samples))
+    cov_index = irma2pandas.coverage_index(coverage_df)
+    stats_df = irma2pandas.coverage_stats(cov_index, live["ref_lens"], virus)
+    live["medians"] = replace_samples(
+        live["medians"], samples, pivot4heatmap(stats_df)
+    )
+    createheatmap(irma_path, live["medians"])
+    live["refs"] = pd.concat(
+        [live["refs"], coverage_df[["Reference_Name"]].drop_duplicates()]
+    ).drop_duplicates()
+    segments, segset, segcolor = irma2pandas.returnSegData(live["refs"])
+    write_ref_data(irma_path, live["ref_lens"], segments, segset, segcolor)
+    createcoverageplot(irma_path, cov_index, segments, segcolor)
+
+
+def watch(irma_path, batch, interval):
+    # Follow the IRMA/<sample>.irma.fin markers and fold finished samples into
+    # the dashboard at most `batch` at a time, until every sample in the
+    # samplesheet has finished or the final build has started
+    expected = set(pd.read_csv(samplesheet)["Sample ID"].astype(str))
+    live = {
+        "reads": None,
+        "coverage": None,
+        "medians": None,
+        "refs": pd.DataFrame(columns=["Reference_Name"]),
+        "ref_lens": {},
+    }
+    built = {}
+    makedirs(irma_path, exist_ok=True)
+    fd = completion.inotify_watch(irma_path)
+    try:
+        while True:
+            # The final rule touches its start marker before it builds, so no
+            # batch is begun once it is running
+            if op.isfile(f"{irma_path}/prepareIRMAjson.start") or op.isfile(
+                f"{irma_path}/prepareIRMAjson.fin"
+            ):
+                print(
+                    f"Final build started, live updates stopped after"
+                    f" {len(built)} samples"
+                )
+                return
+            finished = finished_samples(irma_path)
+            fingerprints = {
+                s: irma2pandas.sample_fingerprint(f"{irma_path}/{s}")
+                for s in finished
+                if op.isdir(f"{irma_path}/{s}/tables")
+            }
+            pending = [s for s in fingerprints if built.get(s) != fingerprints[s]]
+            if len(pending) > 0:
+                samples = pending[:batch]
+                print(
+                    f"Live update for {', '.join(samples)}"
+                    f" ({len(pending) - len(samples)} more waiting)"
+                )
+                live_update(irma_path, live, samples)
+                built.update({s: fingerprints[s] for s in samples})
+                continue
+            if expected.issubset(finished):
+                print(f"Live updates finished for {len(built)} samples")
+                return
+            completion.wait_for_event(fd, interval)
+    finally:
+        if fd is not None:
+            close(fd)
 
 
 if __name__ == "__main__":
-    generate_figs(irma_path, *generate_dfs(irma_path))
+    if workers > 1:
+        # Serialized once here so the forked workers inherit it
+        figspec.template()
+        shared_pool = irma2pandas.process_pool(workers)
+    try:
+        if watch_mode:
+            watch(
+                irma_path,
+                cli_option("--watch-batch", 8),
+                cli_option("--watch-interval", 30),
+            )
+        else:
+            fingerprints = irma2pandas.sample_fingerprints(irma_path)
+            irma2pandas.sweep_table_cache(irma_path)
+            if incremental:
+                rebuild = samples_to_rebuild(irma_path, fingerprints)
+            else:
+                rebuild = None
+            generate_figs(
+                irma_path, *generate_dfs(irma_path, fingerprints, rebuild), rebuild
+            )
+            write_build_manifest(irma_path, fingerprints)
+    finally:
+        if shared_pool is not None:
+            shared_pool.shutdown()
@@ -0,0 +1,173 @@
+import numpy as np
+import json
+import struct
+from sys import argv, exit
+from os import environ, getpid, replace
+from os.path import dirname, realpath, getmtime
+from glob import glob
+from functools import lru_cache
+
+repo_path = realpath(dirname(dirname(__file__)))
+# Images set these outside /spyne, which dev containers mount the checkout over
+catalog_path = environ.get(
+    "SPYNE_REFERENCE_CATALOG", f"{repo_path}/data/references/reference_catalog.bin"
+)
+irma_refs_dir = environ.get("SPYNE_IRMA_REFS", f"{repo_path}/data/references/irma")
+catalog_magic = b"SPYNECAT"
+catalog_version = 1
+
+# Build inputs for the catalog; query them at runtime through load_catalog()
+proteins = {
+    "sc2": "ORF10 S orf1ab ORF6 ORF8 ORF7a ORF7b M N ORF3a E ORF9b",
+    "flu": "PB1-F2 HA M1 NP HA1 BM2 NB PB2 NEP PB1 HA-signal PA-X NS1 M2 NA PA",
+}
+ref_proteins = {
+    "ORF10": "SARS-CoV-2",
+    "S": "SARS-CoV-2",
+    "orf1ab": "SARS-CoV-2",
+    "ORF6": "SARS-CoV-2",
+    "ORF8": "SARS-CoV-2",
+    "ORF7a": "SARS-CoV-2",
+    "ORF7b": "SARS-CoV-2",
+    "N": "SARS-CoV-2",
+    "ORF3a": "SARS-CoV-2",
+    "E": "SARS-CoV-2",
+    "ORF9b": "SARS-CoV-2",
+    "SARS-CoV-2": "SARS-CoV-2",
+    "PB1-F2": "A_PB1 B_PB1",
+    "HA": "A_HA_H10 A_HA_H11 A_HA_H12 A_HA_H13 A_HA_H14 A_HA_H15 A_HA_H16 A_HA_H1 \
+        A_HA_H2 A_HA_H3 A_HA_H4 A_HA_H5 A_HA_H6 A_HA_H7 A_HA_H8 A_HA_H9 B_HA",
+    "M1": "A_MP B_MP",
+    "NP": "A_NP B_NP",
+    "HA1": "A_HA_H10 A_HA_H11 A_HA_H12 A_HA_H13 A_HA_H14 A_HA_H15 A_HA_H16 A_HA_H1 \
+        A_HA_H2 A_HA_H3 A_HA_H4 A_HA_H5 A_HA_H6 A_HA_H7 A_HA_H8 A_HA_H9 B_HA",
+    "BM2": "B_MP",
+    "NB": "B_MP",
+    "PB2": "A_PB2 B_PB2",
+    "NEP": "A_NS B_NS",
+    "PB1": "A_PB1 B_PB1",
+    "HA-signal": "A_HA_H10 A_HA_H11 A_HA_H12 A_HA_H13 A_HA_H14 A_HA_H15 A_HA_H16 A_HA_H1 \
+        A_HA_H2 A_HA_H3 A_HA_H4 A_HA_H5 A_HA_H6 A_HA_H7 A_HA_H8 A_HA_H9 B_HA",
+    "PA-X": "A_PA B_PA",
+    "NS1": "A_NS B_NS",
+    "NS": "A_NS B_NS",
+    "M2": "A_MP B_MP",
+    "M": "A_MP B_MP SARS-CoV-2",
+    "NA": "A_NA_N1 A_NA_N2 A_NA_N3 A_NA_N4 A_NA_N5 A_NA_N6 A_NA_N7 A_NA_N8 A_NA_N9 B_NA",
+    "PA": "A_PA B_PA",
+}
+orf_pos = {
+    "orf1ab": (266, 21556),
+    "S": [21563, 25385],
+    "ORF3a": [25393, 26221],
+    "E": [26245, 26473],
+    "M": [26523, 27192],
+    "ORF6": [27202, 27388],
+    "ORF7a": [27394, 27759],
+    "ORF7b": [27756, 27887],
+    "ORF8": [27894, 28260],
+    "N": [28274, 29534],
+    "ORF10": [29558, 29675],
+    "ORF9b": [28284, 28577],
+}
+
+
+def bundled_irma_fastas():
+    # IRMA module reference FASTAs copied in from the IRMA image at build time
+    return sorted(glob(f"{irma_refs_dir}/*.fasta"))
+
+
+def catalog_sources():
+    return (
+        glob(f"{repo_path}/data/references/*.seq")
+        + bundled_irma_fastas()
+        + [realpath(__file__)]
+    )
+
+
+def build_catalog(irma_ref_fastas=None):
+    import dais2pandas  # type: ignore
+    from fastaio import read_fasta  # type: ignore
+
+    refs = dais2pandas.dais2df(
+        f"{repo_path}/data/references/",
+        dais2pandas.seqcols,
+        dais2pandas.seqcols_rename,
+        ".seq",
+    )
+    refs = refs.groupby(["Sample", "Protein"])["Aligned AA Sequence"].first()
+    aa_index, payload, offset = {}, [], 0
+    for (ref, protein), seq in refs.items():
+        seq = seq.encode()
+        aa_index[f"{ref}|{protein}"] = [offset, len(seq)]
+        payload.append(seq)
+        offset += len(seq)
+    if irma_ref_fastas is None:
+        irma_ref_fastas = bundled_irma_fastas()
+    ref_lens = {}
+    for f in irma_ref_fastas:
+        for ref, seq in read_fasta(f):
+            ref_lens[ref.split()[0]] = len(seq)
+    header = {
+        "version": catalog_version,
+        "proteins": {k: v.split() for k, v in proteins.items()},
+        "ref_proteins": {k: v.split() for k, v in ref_proteins.items()},
+        "orf_pos": orf_pos,
+        "ref_lens": ref_lens,
+        "aa_index": aa_index,
+    }
+    return header, b"".join(payload)
+
+
+def write_catalog(header, payload, path=catalog_path):
+    header = json.dumps(header).encode()
+    with open(f"{path}.{getpid()}.tmp", "wb") as out:
+        out.write(catalog_magic + struct.pack("<Q", len(header)) + header + payload)
+    replace(f"{path}.{getpid()}.tmp", path)
+
+
+def catalog_is_stale(path):
+    try:
+        built = getmtime(path)
+    except FileNotFoundError:
+        return True
+    return any(getmtime(f) > built for f in catalog_sources())
+
+
+@lru_cache(maxsize=None)
+def load_catalog(path=catalog_path):
+    if catalog_is_stale(path):
+        # Never written here: the install may be read-only and concurrent jobs
+        # would race on it. `python refcatalog.py` rebuilds the file.
+        print(f"{path} is missing or out of date, building the reference catalog in memory")
+        header, payload = build_catalog()
+        header = json.loads(json.dumps(header))
+        header["aa"] = np.frombuffer(payload, dtype=np.uint8)
+        return header
+    with open(path, "rb") as d:
+        magic, header_len = d.read(8), struct.unpack("<Q", d.read(8))[0]
+        header = json.loads(d.read(header_len))
+    if magic != catalog_magic or header["version"] != catalog_version:
+        raise ValueError(f"{path} is not a version {catalog_version} reference catalog")
+    if sum(length for _, length in header["aa_index"].values()) > 0:
+        header["aa"] = np.memmap(path, dtype=np.uint8, mode="r", offset=16 + header_len)
+    else:
+        header["aa"] = np.zeros(0, dtype=np.uint8)
+    return header
+
+
+def ref_aa(catalog, ref, protein):
+    offset, length = catalog["aa_index"][f"{ref}|{protein}"]
+    return catalog["aa"][offset : offset + length]
+
+
+if __name__ == "__main__":
+    if "-h" in argv[1:] or "--help" in argv[1:]:
+        exit(
+            f"\n\tUSAGE: python {__file__} [irma_reference.fasta ...]\n"
+            f"\n\t\t*Builds {catalog_path}"
+            f"\n\t\t*IRMA module reference fastas add reference lengths to the catalog;"
+            f"\n\t\t defaults to {irma_refs_dir}/*.fasta\n"
+        )
+    write_catalog(*build_catalog(argv[1:] or None))
+    print(f"Reference catalog saved to {catalog_path}")
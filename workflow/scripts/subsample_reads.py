@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+import gzip
+import random
+from itertools import islice, zip_longest
+from math import exp, floor, log
+from os import listdir
+from os.path import isdir
+from sys import argv, exit, stderr
+
+def fastq_files(paths):
+    for p in paths:
+        if isdir(p):
+            for f in sorted(listdir(p)):
+                if "fastq" in f and not f.startswith("."):
+                    yield f"{p}/{f}"
+        else:
+            yield p
+
+
+def open_fastq(fastq):
+    with open(fastq, "rb") as d:
+        magic = d.read(2)
+    if magic == b"\x1f\x8b":
+        return gzip.open(fastq, "rb")
+    return open(fastq, "rb", buffering=1 << 20)
+
+
+def broken(record):
+    header, seq, plus, qual = record
+    return (
+        header[:1] != b"@"
+        or plus[:1] != b"+"
+        or len(seq.rstrip()) != len(qual.rstrip())
+    )
+
+
+def read_fastqs(paths, counts):
+    for fastq in fastq_files(paths):
+        try:
+            with open_fastq(fastq) as d:
+                while True:
+                    record = tuple(islice(d, 4))
+                    if len(record) < 4:
+                        if len(record) > 0:
+                            counts["broken"] += 1
+                        break
+                    if broken(record):
+                        counts["broken"] += 1
+                        yield None
+                    else:
+                        counts["reads"] += 1
+                        yield record
+        except (EOFError, OSError) as E:
+            print(f"{fastq} is truncated or unreadable ({E}), skipping the rest of it", file=stderr)
+
+
+def paired_records(r1, r2, counts):
+    missing = object()
+    for rec1, rec2 in zip_longest(r1, r2, fillvalue=missing):
+        if rec1 is missing or rec2 is missing:
+            exit("R1 and R2 fastqs have different numbers of reads")
+        if rec1 is None or rec2 is None:
+            yield None
+        else:
+            counts["pairs"] += 1
+            yield rec1, rec2
+
+
+def reservoir_sample(records, target, seed):
+    # Algorithm L: once the reservoir is full, jump straight to the next
+    # record that replaces an entry instead of drawing once per record
+    rng = random.Random(seed)
+    records = enumerate(r for r in records if r is not None)
+    reservoir = list(islice(records, target))
+    if len(reservoir) < target or target == 0:
+        return reservoir
+    w = exp(log(1.0 - rng.random()) / target)
+    while True:
+        skip = 0
+        if w < 1.0:
+            skip = floor(log(1.0 - rng.random()) / log(1.0 - w))
+        nxt = next(islice(records, skip, None), None)
+        if nxt is None:
+            break
+        reservoir[rng.randrange(target)] = nxt
+        w *= exp(log(1.0 - rng.random()) / target)
+    return sorted(reservoir, key=lambda x: x[0])
+
+
+def write_fastq(records, out):
+    with open(out, "wb", buffering=1 << 20) as o:
+        for record in records:
+            o.writelines(record)
+
+
+if __name__ == "__main__":
+    if len(argv) < 6 or argv[1] not in ("single", "paired"):
+        exit(
+            f"\n\tUSAGE: python {__file__} single <target_reads> <seed> <out.fastq> <fastq or fastq_dir> ...\n"
+            f"\t       python {__file__} paired <target_reads> <seed> <out_R1.fastq> <out_R2.fastq> <R1.fastq> <R2.fastq>\n"
+            f"\n\t\t*Fastq inputs may be gzipped; directories are read in name order"
+            f"\n\t\t*Reads are streamed once and a seeded reservoir of <target_reads> is written in input order\n"
+        )
+    target, seed = int(argv[2]), int(argv[3])
+    if argv[1] == "single":
+        counts = {"reads": 0, "broken": 0}
+        sampled = reservoir_sample(read_fastqs(argv[5:], counts), target, seed)
+        write_fastq((record for _, record in sampled), argv[4])
+        print(
+            f"Sampled {len(sampled)} of {counts['reads']} reads into {argv[4]}"
+            f" ({counts['broken']} broken reads tossed)"
+        )
+    else:
+        if len(argv) != 8:
+            exit("paired mode takes <out_R1.fastq> <out_R2.fastq> <R1.fastq> <R2.fastq>")
+        counts = {"reads": 0, "broken": 0, "pairs": 0}
+        mates = {"reads": 0, "broken": 0}
+        pairs = paired_records(
+            read_fastqs([argv[6]], counts), read_fastqs([argv[7]], mates), counts
+        )
+        sampled = reservoir_sample(pairs, target, seed)
+        write_fastq((pair[0] for _, pair in sampled), argv[4])
+        write_fastq((pair[1] for _, pair in sampled), argv[5])
+        print(
+            f"Sampled {len(sampled)} of {counts['pairs']} read pairs into {argv[4]} and {argv[5]}"
+            f" ({counts['broken'] + mates['broken']} broken reads tossed)"
+        )